@@ -0,0 +1,113 @@
+# abs_backtest.py
+# Walk-forward backtesting for the ABS engine
+
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from abs_engine import ABSEngine, PriorState, draws_to_arrays, number_masks, popcount
+
+# Approximate average EuroMillions payouts (EUR) per (main hits, star hits)
+# tier; pass your own table to walk_forward for exact figures.
+EUROMILLIONS_PRIZES = {
+    (5, 2): 17_000_000, (5, 1): 300_000, (5, 0): 50_000,
+    (4, 2): 2_500, (4, 1): 150, (4, 0): 50,
+    (3, 2): 60, (3, 1): 12, (3, 0): 10,
+    (2, 2): 15, (2, 1): 6, (2, 0): 4,
+    (1, 2): 8,
+}
+TICKET_COST = 2.5
+
+
+class BacktestResult:
+    """Tickets and hits from a walk-forward run, one row per backtested draw."""
+
+    def __init__(self, draw_index, tickets_main, tickets_star, hits, prizes, ticket_cost):
+        self.draw_index = draw_index
+        self.tickets_main = tickets_main
+        self.tickets_star = tickets_star
+        self.hits = hits
+        self.prizes = prizes
+        self.ticket_cost = ticket_cost
+
+    def hit_table(self):
+        # Tickets per (main hits, star hits) over the whole run.
+        n_main = self.tickets_main.shape[2] + 1
+        n_star = self.tickets_star.shape[2] + 1
+        tiers = self.hits[..., 0].astype(np.intp) * n_star + self.hits[..., 1]
+        counts = np.bincount(tiers.ravel(), minlength=n_main * n_star).reshape(n_main, n_star)
+        return pd.DataFrame(counts, index=pd.Index(range(n_main), name='Main hits'),
+                            columns=pd.Index(range(n_star), name='Star hits'))
+
+    def winnings(self):
+        table = np.zeros((self.tickets_main.shape[2] + 1, self.tickets_star.shape[2] + 1))
+        for (m, s), prize in self.prizes.items():
+            table[m, s] = prize
+        return table[self.hits[..., 0], self.hits[..., 1]].sum(axis=1)
+
+    def cumulative_returns(self):
+        spend = self.ticket_cost * self.hits.shape[1]
+        return pd.Series(np.cumsum(self.winnings() - spend), index=self.draw_index, name='Cumulative return')
+
+
+def backtest_slice(main, star, start, stop, top_n, prior_config, main_range, star_range,
+                   method='exact', draws=10000, seeds=None):
+    # Fit priors on draws before `start`, then step forward one draw at a time.
+    state = PriorState(main_range, star_range, *prior_config)
+    state.extend(main[:start], star[:start])
+    engine = ABSEngine(main_range=main_range, star_range=star_range, draws=draws)
+    tickets_main = np.empty((stop - start, top_n, main.shape[1]), dtype=np.uint8)
+    tickets_star = np.empty((stop - start, top_n, star.shape[1]), dtype=np.uint8)
+    for i, t in enumerate(range(start, stop)):
+        engine.main_priors, engine.star_priors = state.priors()
+        if method == 'exact':
+            tickets = engine.get_top_probable(top_n)
+        else:
+            engine.seed = seeds[i]
+            engine.simulate_draws()
+            tickets = engine.get_top_combinations(top_n)
+        if len(tickets) < top_n:
+            raise ValueError(f"Only {len(tickets)} distinct tickets for draw {t}; lower top_n")
+        tickets_main[i], tickets_star[i] = draws_to_arrays([combo for combo, _ in tickets])
+        state.update(main[t], star[t])
+    return tickets_main, tickets_star
+
+
+def walk_forward(engine, top_n=5, start=100, method='exact', draws=10000, seed=None, workers=None,
+                 prizes=None, ticket_cost=TICKET_COST):
+    """Backtest the engine's prior model over its loaded history.
+
+    At every draw from ``start`` on, priors are fitted on the earlier draws
+    only (with the engine's prior mode), the top_n tickets are chosen
+    ('exact' uses get_top_probable, 'simulate' runs ``draws`` simulations)
+    and scored against the real result. Time slices run in a process pool
+    when ``workers`` > 1; the result doesn't depend on the split.
+    """
+    main, star = engine.history.main, engine.history.star
+    if not 0 < start < len(main):
+        raise ValueError(f"start must be between 1 and {len(main) - 1}")
+    if method not in ('exact', 'simulate'):
+        raise ValueError(f"Unknown backtest method: {method!r}")
+    state = engine.prior_state
+    prior_config = (state.mode, state.decay, state.window, state.smoothing)
+    seeds = np.random.SeedSequence(seed).spawn(len(main) - start) if method == 'simulate' else None
+    bounds = [(s[0], s[-1] + 1) for s in np.array_split(np.arange(start, len(main)), workers or 1) if len(s)]
+    args = [(main, star, lo, hi, top_n, prior_config, engine.main_range, engine.star_range, method, draws,
+             seeds[lo - start:hi - start] if seeds else None) for lo, hi in bounds]
+    if workers and workers > 1:
+        with ProcessPoolExecutor(max_workers=len(args)) as pool:
+            parts = list(pool.map(backtest_slice, *zip(*args)))
+    else:
+        parts = [backtest_slice(*a) for a in args]
+    tickets_main = np.concatenate([p[0] for p in parts])
+    tickets_star = np.concatenate([p[1] for p in parts])
+
+    # Score every ticket against the draw it was made for in one pass
+    hits = np.stack([
+        popcount(number_masks(tickets_main.reshape(-1, main.shape[1])).reshape(tickets_main.shape[:2])
+                 & number_masks(main[start:])[:, None]),
+        popcount(number_masks(tickets_star.reshape(-1, star.shape[1])).reshape(tickets_star.shape[:2])
+                 & number_masks(star[start:])[:, None]),
+    ], axis=-1).astype(np.uint8)
+    return BacktestResult(np.arange(start, len(main)), tickets_main, tickets_star, hits,
+                          EUROMILLIONS_PRIZES if prizes is None else prizes, ticket_cost)
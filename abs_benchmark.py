@@ -0,0 +1,323 @@
+# abs_benchmark.py
+# Benchmarks for the ABS engine hot paths
+#
+#   python abs_benchmark.py --output bench.json
+#   python abs_benchmark.py --baseline benchmark_baseline.json --threshold 0.25
+#   python abs_benchmark.py --dashboard --quick
+
+import argparse
+import ast
+import ctypes
+import ctypes.util
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from abs_engine import ABSEngine, read_draw_history
+
+DRAW_COUNTS = [10_000, 100_000, 500_000]
+HISTORY_SIZES = [500, 2_000, 20_000]
+SCORE_SIZES = [(10_000, 1_800), (100_000, 1_800)]
+# Each case runs until it has been timed for MIN_SECONDS in total, at least
+# ``repeat`` and at most MAX_RUNS times.
+MIN_SECONDS = 1.0
+MAX_RUNS = 2000
+# Throughput is only compared once the baseline or the new run takes this long:
+# below it, best times on a shared machine move by more than the threshold.
+GATE_MIN_SECONDS = 0.02
+
+DASHBOARD = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'easy_dream_dashboard.py')
+
+# Seconds the dashboard probe waits for its simulation to finish.
+DASHBOARD_TIMEOUT = 300
+
+# Run in a fresh interpreter so startup includes every import the dashboard pays
+# for. Prints JSON: first page load, then each view's first show and its reruns.
+DASHBOARD_PROBE = """
+import json, os, sys, time
+start = time.perf_counter()
+deadline = start + float(sys.argv[4])
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file(sys.argv[1], default_timeout=120)
+app.run()
+timings = {'startup': time.perf_counter() - start}
+with open(sys.argv[2], 'rb') as f:
+    app.sidebar.file_uploader[0].set_value(('history.csv', f.read(), 'text/csv'))
+app.run()
+next(b for b in app.sidebar.button if 'Run' in b.label).click().run()
+while 'recorded_run' not in app.session_state:
+    # A failed or cancelled run never records itself; report it instead of polling forever
+    problems = [e.value for e in app.exception] + [e.value for e in app.error] + [w.value for w in app.warning]
+    if problems or time.perf_counter() > deadline:
+        print(f"Simulation did not finish: {problems or 'still running after ' + sys.argv[4] + 's'}",
+              file=sys.stderr, flush=True)
+        # A stuck simulation thread would keep a normal exit waiting on it
+        os._exit(1)
+    time.sleep(0.1)
+    app.run()
+for view in app.sidebar.radio[0].options:
+    start = time.perf_counter()
+    app.sidebar.radio[0].set_value(view).run()
+    timings[f'view {view[2:]}'] = time.perf_counter() - start
+    reruns = []
+    for _ in range(int(sys.argv[3])):
+        start = time.perf_counter()
+        app.run()
+        reruns.append(time.perf_counter() - start)
+    timings[f'rerun {view[2:]}'] = min(reruns)
+print(json.dumps(timings))
+"""
+
+
+def synthetic_history(n, seed=0):
+    # EuroMillions-shaped CSV bytes: n draws of 5 of 50 and 2 of 12.
+    rng = np.random.default_rng(seed)
+    main = np.argsort(rng.random((n, 50)), axis=1)[:, :5] + 1
+    star = np.argsort(rng.random((n, 12)), axis=1)[:, :2] + 1
+    df = pd.DataFrame({'Date': pd.date_range('2004-02-13', periods=n, freq='3D').strftime('%Y-%m-%d')})
+    for i in range(5):
+        df[f'Ball {i + 1}'] = main[:, i]
+    for i in range(2):
+        df[f'Lucky Star {i + 1}'] = star[:, i]
+    return df.to_csv(index=False).encode()
+
+
+def pin_allocator():
+    """Fix glibc malloc's mmap and trim thresholds for this process.
+
+    By default they adapt to the largest blocks freed so far, so whether a
+    case page-faults its arrays in afresh depends on which cases ran before
+    it (a quick run was ~2x slower on simulate_draws @ 10,000 than a full
+    one). Returns False where this isn't glibc.
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'))
+        M_TRIM_THRESHOLD, M_MMAP_THRESHOLD = -1, -3
+        return bool(libc.mallopt(M_MMAP_THRESHOLD, 32 << 20) and libc.mallopt(M_TRIM_THRESHOLD, 256 << 20))
+    except (OSError, AttributeError, TypeError):
+        return False
+
+
+def measure(fn, setup=None, repeat=3, min_seconds=MIN_SECONDS, max_runs=MAX_RUNS):
+    """Best wall time over the timed runs, then one traced run for memory.
+
+    ``peak_bytes`` is the tracemalloc peak during the run and
+    ``retained_blocks`` the net number of allocation blocks it left behind.
+    """
+    times = []
+    while len(times) < repeat or (sum(times) < min_seconds and len(times) < max_runs):
+        state = setup() if setup else None
+        start = time.perf_counter()
+        fn(state)
+        times.append(time.perf_counter() - start)
+    state = setup() if setup else None
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    fn(state)
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    retained_blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+    return {'seconds': min(times), 'runs': len(times), 'peak_bytes': peak, 'retained_blocks': retained_blocks}
+
+
+def simulated_engine(draws):
+    engine = ABSEngine(draws=draws, seed=0)
+    engine.load_draw_history(read_draw_history(io.BytesIO(synthetic_history(2_000))))
+    return engine
+
+
+def suite_cases(draw_counts=DRAW_COUNTS, history_sizes=HISTORY_SIZES, score_sizes=SCORE_SIZES):
+    # (name, size, unit, fn, setup) for every benchmark, in the order they run.
+    cases = []
+    for rows in history_sizes:
+        data = synthetic_history(rows)
+        cases.append(('load_draw_history', rows, 'rows/s',
+                      lambda _, data=data: ABSEngine().load_draw_history(read_draw_history(io.BytesIO(data))), None))
+
+    for draws in draw_counts:
+        def simulated(draws=draws):
+            engine = simulated_engine(draws)
+            engine.simulate_draws()
+            return engine
+        cases.append(('simulate_draws', draws, 'draws/s', lambda engine: engine.simulate_draws(),
+                      lambda draws=draws: simulated_engine(draws)))
+        cases.append(('get_top_combinations', draws, 'draws/s', lambda engine: engine.get_top_combinations(10),
+                      simulated))
+
+    for n_pred, n_actual in score_sizes:
+        def scored(n_pred=n_pred):
+            engine = simulated_engine(n_pred)
+            engine.simulate_draws()
+            return engine
+        actual = simulated_engine(0).history
+        actual = (actual.main[:n_actual], actual.star[:n_actual])
+        cases.append(('score_all_predictions', n_pred * n_actual, 'pairs/s',
+                      lambda engine, actual=actual: engine.score_all_predictions(actual, aggregate=True), scored))
+    return cases
+
+
+def run_cases(cases, repeat=3):
+    records = []
+    for name, size, unit, fn, setup in cases:
+        result = measure(fn, setup, repeat)
+        result.update(name=name, size=size, unit=unit, throughput=size / result['seconds'])
+        records.append(result)
+        print(f"{name:<24} {size:>10,}  {result['throughput']:>14,.0f} {unit}  "
+              f"{result['peak_bytes'] / 2**20:8.1f} MiB peak", file=sys.stderr)
+    return records
+
+
+def run_suite(draw_counts=DRAW_COUNTS, history_sizes=HISTORY_SIZES, score_sizes=SCORE_SIZES, repeat=3):
+    return run_cases(suite_cases(draw_counts, history_sizes, score_sizes), repeat)
+
+
+def dashboard_timings(repeat=3, timeout=DASHBOARD_TIMEOUT):
+    """Wall times of the dashboard in a fresh process, in seconds.
+
+    'startup' is the first page load (imports included), 'view X' the
+    first switch to a view after a run and 'rerun X' the best rerun on it.
+    Needs streamlit. Raises RuntimeError if the dashboard's simulation
+    fails, is cancelled or takes longer than ``timeout`` seconds.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        history = os.path.join(tmp, 'history.csv')
+        with open(history, 'wb') as f:
+            f.write(synthetic_history(2_000))
+        env = {**os.environ, 'EASY_DREAM_RUNS': os.path.join(tmp, 'runs')}
+        try:
+            out = subprocess.run([sys.executable, '-c', DASHBOARD_PROBE, DASHBOARD, history, str(repeat),
+                                  str(timeout)], capture_output=True, text=True, check=True, env=env,
+                                 timeout=2 * timeout)
+        except subprocess.CalledProcessError as error:
+            lines = error.stderr.strip().splitlines()
+            raise RuntimeError(f"Dashboard probe failed: {lines[-1] if lines else error}") from None
+        except subprocess.TimeoutExpired:
+            raise RuntimeError(f"Dashboard probe still running after {2 * timeout}s") from None
+    timings = json.loads(out.stdout.strip().splitlines()[-1])
+    for name, seconds in timings.items():
+        print(f"dashboard {name:<24} {seconds * 1000:10.0f} ms", file=sys.stderr)
+    return timings
+
+
+def dashboard_budget():
+    # STARTUP_BUDGET and RERUN_BUDGET as set in the dashboard, read without running it.
+    with open(DASHBOARD) as f:
+        tree = ast.parse(f.read())
+    budget = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            name = node.targets[0].id
+            if name in ('STARTUP_BUDGET', 'RERUN_BUDGET'):
+                budget[name.lower()] = ast.literal_eval(node.value)
+    return budget
+
+
+def over_budget(timings, startup_budget, rerun_budget):
+    # First view switches are reported but not budgeted: they may import a plotting library.
+    lines = []
+    for name, seconds in timings.items():
+        if name.startswith('view '):
+            continue
+        budget = startup_budget if name == 'startup' else rerun_budget
+        if seconds > budget:
+            lines.append(f"dashboard {name}: {seconds:.2f}s over the {budget:.2f}s budget")
+    return lines
+
+
+def compare(records, baseline, threshold):
+    # Regressions: throughput down or peak memory up by more than ``threshold``.
+    # Throughput is compared once either run takes GATE_MIN_SECONDS, so a fast case that slows past it still fails.
+    return [line for _, line in regressed(records, baseline, threshold)]
+
+
+def regressed(records, baseline, threshold):
+    # (record, message) for each regression compare reports.
+    previous = {(r['name'], r['size']): r for r in baseline['results']}
+    regressions = []
+    for r in records:
+        old = previous.get((r['name'], r['size']))
+        if old is None:
+            continue
+        timed = max(r['seconds'], old['seconds']) >= GATE_MIN_SECONDS
+        if timed and r['throughput'] < old['throughput'] * (1 - threshold):
+            regressions.append((r, f"{r['name']} @ {r['size']:,}: {r['throughput']:,.0f} {r['unit']} "
+                                   f"vs {old['throughput']:,.0f} baseline"))
+        if r['peak_bytes'] > old['peak_bytes'] * (1 + threshold):
+            regressions.append((r, f"{r['name']} @ {r['size']:,}: {r['peak_bytes']:,} peak bytes "
+                                   f"vs {old['peak_bytes']:,} baseline"))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ABS engine hot paths.")
+    parser.add_argument('--output', help="write results as JSON to this file")
+    parser.add_argument('--baseline', help="JSON results to compare against")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="allowed relative slowdown or memory growth (default 0.25)")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--recheck', type=int, default=2,
+                        help="times a regressed case is measured again before it counts (default 2)")
+    parser.add_argument('--quick', action='store_true', help="smallest size of each benchmark only")
+    parser.add_argument('--dashboard', action='store_true',
+                        help="also time dashboard startup and reruns against its budget")
+    args = parser.parse_args(argv)
+
+    pinned = pin_allocator()
+    if args.quick:
+        cases = suite_cases(DRAW_COUNTS[:1], HISTORY_SIZES[:1], SCORE_SIZES[:1])
+    else:
+        cases = suite_cases()
+    records = run_cases(cases, args.repeat)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        # A regression has to reproduce: flagged cases are measured again and their best run kept
+        for _ in range(args.recheck):
+            flagged = {(r['name'], r['size']) for r, _ in regressed(records, baseline, args.threshold)}
+            if not flagged:
+                break
+            print(f"rechecking {len(flagged)} case(s)", file=sys.stderr)
+            again = {(r['name'], r['size']): r
+                     for r in run_cases([c for c in cases if c[:2] in flagged], args.repeat)}
+            records = [max(r, again.get((r['name'], r['size']), r), key=lambda r: r['throughput'])
+                       for r in records]
+    report = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'pinned_allocator': pinned,
+        'results': records,
+    }
+    failures = []
+    if args.dashboard:
+        try:
+            report['dashboard'] = dashboard_timings(args.repeat)
+        except RuntimeError as error:
+            failures.append(str(error))
+        else:
+            failures += over_budget(report['dashboard'], **dashboard_budget())
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if baseline is not None:
+        failures += compare(records, baseline, args.threshold)
+    for line in failures:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
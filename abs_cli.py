@@ -0,0 +1,165 @@
+# abs_cli.py
+# Headless batch runner for the ABS engine
+#
+#   python abs_cli.py draws.csv --draws 100000 --seed 1 --output run.json
+#   python abs_cli.py a.csv b.csv --draws 10000 100000 --seed 1 2 3 --format csv --output sweep/
+#
+# Every CSV is run at every (draws, seed) setting. Only numpy and pandas are
+# imported up front; matplotlib is loaded only when --plot is given.
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from abs_engine import ABSEngine, read_draw_history
+
+MODES = ('simulate', 'stream', 'adaptive', 'exact')
+
+
+def run_one(engine, mode, top_n, workers=None, confidence=0.95, tolerance=0.1):
+    # Runs the engine in the given mode and returns its top_n as plain records.
+    if mode == 'exact':
+        return [{'rank': i, 'main': list(main), 'star': list(star), 'probability': p}
+                for i, ((main, star), p) in enumerate(engine.get_top_probable(top_n), 1)]
+    if mode == 'adaptive':
+        engine.simulate_adaptive(top_n=top_n, confidence=confidence, tolerance=tolerance)
+    else:
+        engine.simulate_draws(workers=workers, stream=mode == 'stream')
+    return [{'rank': i, 'main': list(main), 'star': list(star), 'count': count}
+            for i, ((main, star), count) in enumerate(engine.get_top_combinations(top_n), 1)]
+
+
+def sweep(paths, draw_counts, seeds, mode='simulate', top_n=10, workers=None, confidence=0.95,
+          sketch_size=None, prior_mode='all', decay=0.99, window=None, store=None, tolerance=0.1):
+    """One result dict per (CSV, draws, seed), in that nesting order.
+
+    Seeds left as None get fresh entropy, which is recorded so any run can
+    be repeated exactly. Exact mode simulates nothing, so it runs once per CSV.
+    """
+    simulated = mode != 'exact'
+    if not simulated:
+        draw_counts, seeds = [0], [None]
+    results = []
+    for path in paths:
+        engine = ABSEngine(sketch_size=sketch_size, prior_mode=prior_mode, decay=decay, window=window)
+        engine.load_draw_history(read_draw_history(path))
+        for draws in draw_counts:
+            for seed in seeds:
+                engine.draws = draws
+                engine.seed = np.random.SeedSequence(seed).entropy if simulated else None
+                start = time.perf_counter()
+                with engine.instrument() as stats:
+                    top = run_one(engine, mode, top_n, workers, confidence, tolerance)
+                elapsed = time.perf_counter() - start
+                result = {
+                    'csv': path, 'mode': mode, 'prior_mode': prior_mode, 'draws': draws,
+                    'draws_used': engine.draws_used if simulated else 0, 'seed': engine.seed,
+                    'stop_reason': engine.stop_reason if mode == 'adaptive' else None,
+                    'top': top,
+                    'main_counts': engine.main_counts.tolist() if simulated else None,
+                    'star_counts': engine.star_counts.tolist() if simulated else None,
+                    'main_priors': engine.main_priors.tolist(), 'star_priors': engine.star_priors.tolist(),
+                    'stats': stats.as_dict(),
+                }
+                if store is not None and simulated:
+                    result['run_id'] = store.save(engine, csv=path, mode=mode, stats=result['stats'])
+                results.append(result)
+                print(f"{os.path.basename(path)} draws={draws:,} seed={engine.seed} "
+                      f"done in {elapsed:.2f}s", file=sys.stderr)
+    return results
+
+
+def run_label(result):
+    return f"{os.path.splitext(os.path.basename(result['csv']))[0]}-d{result['draws']}-s{result['seed']}"
+
+
+def write_csv(results, directory):
+    # Long-format top.csv and histograms.csv, one block of rows per run.
+    os.makedirs(directory, exist_ok=True)
+    keys = ['csv', 'mode', 'prior_mode', 'draws', 'draws_used', 'seed']
+    top = pd.DataFrame([{**{k: r[k] for k in keys}, **row,
+                         'main': ' '.join(map(str, row['main'])), 'star': ' '.join(map(str, row['star']))}
+                        for r in results for row in r['top']])
+    top.to_csv(os.path.join(directory, 'top.csv'), index=False)
+    hist = pd.DataFrame([{**{k: r[k] for k in keys}, 'kind': kind, 'number': number,
+                          'count': None if r[f'{kind}_counts'] is None else r[f'{kind}_counts'][number - 1],
+                          'prior': r[f'{kind}_priors'][number - 1]}
+                         for r in results for kind in ('main', 'star')
+                         for number in range(1, len(r[f'{kind}_priors']) + 1)])
+    hist.to_csv(os.path.join(directory, 'histograms.csv'), index=False)
+
+
+def plot_histograms(results, directory):
+    # One PNG per run; the only place the CLI touches matplotlib.
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    os.makedirs(directory, exist_ok=True)
+    for r in results:
+        fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 5), gridspec_kw={'width_ratios': [4, 1]})
+        for ax, kind, color in ((ax1, 'main', 'skyblue'), (ax2, 'star', 'gold')):
+            values = r[f'{kind}_counts'] or r[f'{kind}_priors']
+            ax.bar(range(1, len(values) + 1), values, color=color, edgecolor='black', alpha=0.7)
+            ax.set_title(f"{kind.capitalize()} {'frequency' if r[f'{kind}_counts'] else 'prior'}")
+            ax.set_xlabel("Number")
+        fig.suptitle(run_label(r))
+        fig.savefig(os.path.join(directory, f"{run_label(r)}.png"), dpi=80)
+        plt.close(fig)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run ABS engine simulations without Streamlit.")
+    parser.add_argument('csv', nargs='+', help="draw history CSV files")
+    parser.add_argument('--draws', type=int, nargs='+', default=[100000], help="simulated draws per run")
+    parser.add_argument('--seed', type=int, nargs='+', default=[None], help="seeds (default: fresh entropy)")
+    parser.add_argument('--mode', choices=MODES, default='simulate',
+                        help="simulate in memory, stream into counts, stop adaptively, or rank exactly")
+    parser.add_argument('--top-n', type=int, default=10)
+    parser.add_argument('--workers', type=int, help="worker processes for simulate/stream")
+    parser.add_argument('--confidence', type=float, default=0.95, help="adaptive stopping confidence")
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help="adaptive stopping: relative half-width of the top-N frequency intervals")
+    parser.add_argument('--sketch-size', type=int, help="count combinations in a Space-Saving sketch")
+    parser.add_argument('--prior-mode', choices=('all', 'decay', 'window'), default='all')
+    parser.add_argument('--decay', type=float, default=0.99)
+    parser.add_argument('--window', type=int)
+    parser.add_argument('--format', choices=('json', 'csv'), default='json')
+    parser.add_argument('--output', help="JSON file, or directory for CSV (default: JSON to stdout)")
+    parser.add_argument('--plot', metavar='DIR', help="also write a histogram PNG per run to DIR")
+    parser.add_argument('--store', metavar='DIR', help="also save each simulated run to a RunStore at DIR")
+    args = parser.parse_args(argv)
+
+    if args.format == 'csv' and not args.output:
+        parser.error("--format csv needs --output DIR")
+    if args.prior_mode == 'window' and not args.window:
+        parser.error("--prior-mode window needs --window N")
+    if args.workers and args.mode not in ('simulate', 'stream'):
+        parser.error(f"--workers only applies to --mode simulate or stream, not {args.mode}")
+    store = None
+    if args.store:
+        from abs_store import RunStore
+        store = RunStore(args.store)
+
+    results = sweep(args.csv, args.draws, args.seed, args.mode, args.top_n, args.workers, args.confidence,
+                    args.sketch_size, args.prior_mode, args.decay, args.window, store, args.tolerance)
+    if args.format == 'csv':
+        write_csv(results, args.output)
+    elif args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    if args.plot:
+        plot_histograms(results, args.plot)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
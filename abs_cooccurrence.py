@@ -0,0 +1,45 @@
+# abs_cooccurrence.py
+# Pair and triple co-occurrence counts over draw arrays
+
+import itertools
+import numpy as np
+
+# Draws indexed per bincount pass, to bound the temporary index arrays.
+CHUNK = 1 << 16
+
+
+def _tuple_counts(rows, n, size):
+    # Dense counts of every size-subset of each sorted row, indexed base n.
+    counts = np.zeros(n ** size, dtype=np.int64)
+    positions = list(itertools.combinations(range(rows.shape[1]), size))
+    for lo in range(0, len(rows), CHUNK):
+        block = rows[lo:lo + CHUNK].astype(np.intp) - 1
+        index = np.zeros((len(positions), len(block)), dtype=np.intp)
+        for p, cols in enumerate(positions):
+            for col in cols:
+                index[p] = index[p] * n + block[:, col]
+        counts += np.bincount(index.ravel(), minlength=n ** size)[:n ** size]
+    return counts
+
+
+def pair_counts(rows, n):
+    """Symmetric (n, n) matrix of how often numbers i+1 and j+1 share a row.
+
+    The diagonal holds each number's own count. Rows must be sorted.
+    """
+    upper = _tuple_counts(rows, n, 2).reshape(n, n)
+    matrix = upper + upper.T
+    matrix[np.diag_indices(n)] = np.bincount(rows.ravel(), minlength=n + 1)[1:n + 1]
+    return matrix
+
+
+def triple_counts(rows, n):
+    # Flat dense counts of sorted triples, index (a-1)*n*n + (b-1)*n + (c-1).
+    return _tuple_counts(rows, n, 3)
+
+
+def sparse_triples(counts, n):
+    # The triples seen at least once, as (m, 3) uint8 numbers and their counts.
+    index = np.flatnonzero(counts)
+    triples = np.stack(np.unravel_index(index, (n, n, n)), axis=1) + 1
+    return triples.astype(np.uint8), counts[index]
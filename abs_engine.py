@@ -2,53 +2,1117 @@
 # abs_engine.py
 # Adaptive Bayesian Simulation (ABS) Core Engine
 
+import functools
+import heapq
+import itertools
+import math
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from statistics import NormalDist
 import numpy as np
 import pandas as pd
-from collections import Counter
+from abs_cooccurrence import pair_counts, sparse_triples, triple_counts
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Draws are generated in fixed-size blocks, each from its own child of the
+# engine seed, so a seeded run is reproducible bit-for-bit.
+SAMPLE_BLOCK = 1 << 16
+# Prediction x actual pairs scored per chunk in score_all_predictions.
+SCORE_CHUNK = 1 << 16
+# Race keys (scenarios x draws x numbers) computed at once in run_scenarios.
+SCENARIO_CHUNK = 1 << 22
+
+
+# Column layouts accepted for draw history CSVs: (main columns, star columns).
+DRAW_SCHEMAS = [
+    ([f'Ball {i}' for i in range(1, 6)], [f'Lucky Star {i}' for i in range(1, 3)]),
+    ([f'Main_{i}' for i in range(1, 6)], [f'Star_{i}' for i in range(1, 3)]),
+]
+# Date layouts tried in turn for the Date column. Day-first only: a EuroMillions
+# history written 03/02/2004 means 3 February.
+DATE_FORMATS = ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y', '%d %b %Y', '%a %d %b %Y', '%d-%b-%Y']
+
+
+def detect_schema(columns):
+    columns = set(columns)
+    for main_cols, star_cols in DRAW_SCHEMAS:
+        if columns.issuperset(main_cols + star_cols):
+            return main_cols, star_cols
+    raise ValueError("Expected 'Ball 1..5' / 'Lucky Star 1..2' or 'Main_1..5' / 'Star_1..2' columns")
+
+
+def read_draw_history(source):
+    # Reads only the draw columns (plus Date, if present) as integers. Wide enough
+    # that out-of-range numbers stay out of range for history_arrays to drop.
+    header = pd.read_csv(source, nrows=0).columns
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    main_cols, star_cols = detect_schema(header)
+    usecols = [c for c in ['Date'] if c in header] + main_cols + star_cols
+    try:
+        return pd.read_csv(source, usecols=usecols, dtype={c: np.int64 for c in main_cols + star_cols})
+    except (ValueError, OverflowError):
+        # Missing numbers can't be held as integers; history_arrays drops those rows.
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        return pd.read_csv(source, usecols=usecols, dtype={c: np.float32 for c in main_cols + star_cols})
+
+
+def parse_draw_dates(dates):
+    # Dates under the first of DATE_FORMATS that reads every one of them, else None.
+    for fmt in DATE_FORMATS:
+        parsed = pd.to_datetime(dates, format=fmt, errors='coerce')
+        if len(parsed) and not parsed.isna().any():
+            return parsed.to_numpy()
+    return None
+
+
+def draw_order(dates):
+    # Row order that puts the oldest draw first: file order, reversed when the
+    # dates run newest-first, sorted only when every date parses.
+    rows = np.arange(len(dates))
+    dates = parse_draw_dates(dates.astype(str).str.strip())
+    if dates is None or (dates[1:] >= dates[:-1]).all():
+        return rows
+    if (dates[1:] <= dates[:-1]).all():
+        return rows[::-1]
+    return np.argsort(dates, kind='stable')
+
+
+def history_arrays(df, main_range=50, star_range=12):
+    # Sorted (n, 5) and (n, 2) uint8 arrays, oldest draw first when there is a
+    # Date column; rows with missing or out-of-range numbers are dropped.
+    main_cols, star_cols = detect_schema(df.columns)
+    if 'Date' in df.columns:
+        df = df.iloc[draw_order(df['Date'])]
+    draws = df[main_cols + star_cols].dropna().to_numpy(dtype=np.float64)
+    main, star = draws[:, :len(main_cols)], draws[:, len(main_cols):]
+    valid = ((main >= 1) & (main <= main_range)).all(axis=1) & ((star >= 1) & (star <= star_range)).all(axis=1)
+    return (np.sort(main[valid].astype(np.uint8), axis=1),
+            np.sort(star[valid].astype(np.uint8), axis=1))
+
+
+def sample_without_replacement(rng, priors, k, n):
+    # Exponential race (equivalent to Gumbel-top-k): the k smallest E_i / p_i
+    # follow the same law as k successive weighted picks without replacement.
+    keys = rng.standard_exponential((n, priors.size))
+    with np.errstate(divide='ignore'):
+        keys /= priors
+    return race_winners(keys, k)
+
+
+def race_winners(keys, k):
+    # Sorted 1-based positions of the k smallest keys along the last axis.
+    picks = np.argpartition(keys, k - 1, axis=-1)[..., :k]
+    picks.sort(axis=-1)
+    return (picks + 1).astype(np.uint8)
+
+
+def block_plan(draws, seed=None):
+    # (seed sequence, size) for every block; identical for a seed whatever the caller does with it.
+    n_blocks = -(-draws // SAMPLE_BLOCK)
+    sizes = [min(SAMPLE_BLOCK, draws - b * SAMPLE_BLOCK) for b in range(n_blocks)]
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    return list(zip(seed.spawn(n_blocks), sizes))
+
+
+def sample_block(seq, main_priors, star_priors, n):
+    rng = np.random.default_rng(seq)
+    main = sample_without_replacement(rng, main_priors, 5, n)
+    star = sample_without_replacement(rng, star_priors, 2, n)
+    return main, star
+
+
+def merge_counts(keys, counts):
+    # Sum the counts of equal keys; returns sorted unique keys.
+    order = np.argsort(keys, kind='stable')
+    keys, counts = keys[order], counts[order]
+    if len(keys) == 0:
+        return keys, counts
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return keys[starts], np.add.reduceat(counts, starts)
+
+
+def binomial_table(n, k):
+    # table[i, j] = C(i, j) for 0 <= i <= n, 0 <= j <= k
+    return np.array([[math.comb(i, j) for j in range(k + 1)] for i in range(n + 1)], dtype=np.int64)
+
+
+def combination_rank(rows, n):
+    # Colex rank of each sorted row of 1-based numbers among the C(n, k) k-subsets.
+    k = rows.shape[1]
+    table = binomial_table(n, k)
+    ranks = np.zeros(len(rows), dtype=np.int64)
+    for j in range(k):
+        ranks += table[rows[:, j].astype(np.intp) - 1, j + 1]
+    return ranks
+
+
+def combination_unrank(ranks, n, k):
+    table = binomial_table(n, k)
+    ranks = np.array(ranks, dtype=np.int64)
+    rows = np.empty((len(ranks), k), dtype=np.uint8)
+    for j in range(k, 0, -1):
+        # Largest c with C(c, j) <= rank; column j of the table is nondecreasing.
+        c = np.searchsorted(table[:, j], ranks, side='right') - 1
+        rows[:, j - 1] = c + 1
+        ranks = ranks - table[c, j]
+    return rows
+
+
+def encode_combos(main, star, main_range=50, star_range=12):
+    # One int64 per ticket: main rank * C(star_range, 2) + star rank.
+    n_star = math.comb(star_range, star.shape[1])
+    return combination_rank(main, main_range) * n_star + combination_rank(star, star_range)
+
+
+def decode_combos(keys, main_range=50, star_range=12, main_k=5, star_k=2):
+    keys = np.asarray(keys, dtype=np.int64)
+    main_keys, star_keys = np.divmod(keys, math.comb(star_range, star_k))
+    return combination_unrank(main_keys, main_range, main_k), combination_unrank(star_keys, star_range, star_k)
+
+
+def wilson_interval(count, n, z):
+    # Wilson score interval for a frequency of count in n trials.
+    p = count / n
+    centre = (p + z * z / (2 * n)) / (1 + z * z / n)
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+    return max(0.0, centre - half), min(1.0, centre + half)
+
+
+def count_is_precise(count, n, z, tolerance):
+    # Whether the interval's half-width is within tolerance of the observed frequency.
+    if count <= 0:
+        return False
+    low, high = wilson_interval(count, n, z)
+    return (high - low) / 2 <= tolerance * count / n
+
+
+def top_keys(keys, counts, top_n):
+    # Highest counts first, ties broken by the smaller key.
+    if top_n <= 0:
+        return keys[:0], counts[:0]
+    if len(keys) > top_n:
+        keep = np.argpartition(-counts, top_n - 1)[:top_n]
+        cutoff = counts[keep].min()
+        keep = np.flatnonzero(counts >= cutoff)
+        keys, counts = keys[keep], counts[keep]
+    order = np.lexsort((keys, -counts))[:top_n]
+    return keys[order], counts[order]
+
+
+@functools.lru_cache(maxsize=None)
+def pick_orders(k):
+    return np.array(list(itertools.permutations(range(k))), dtype=np.intp)
+
+
+def subset_probability(priors, rows):
+    # Exact chance that k successive weighted picks without replacement give
+    # exactly the set in each row: a sum over its k! pick orders.
+    rows = np.atleast_2d(np.asarray(rows, dtype=np.intp))
+    p = np.asarray(priors, dtype=np.float64)[rows - 1]
+    orders = p[:, pick_orders(rows.shape[1])]
+    taken = np.cumsum(orders, axis=2) - orders
+    return np.prod(orders / (1.0 - taken), axis=2).sum(axis=1)
+
+
+def top_subsets(priors, k, top_n):
+    """The top_n most likely k-sets as ((numbers), probability), best first.
+
+    Best-first search over index sets into the priors sorted high to low: a
+    set's successors swap one member for the next lighter number, which can
+    only lower its probability, so sets leave the heap in order.
+    """
+    order = np.argsort(-np.asarray(priors), kind='stable')
+    n = len(order)
+    if top_n <= 0 or k > n:
+        return []
+    start = tuple(range(k))
+    heap = [(-subset_probability(priors, [order[list(start)] + 1])[0], start)]
+    seen = {start}
+    found = []
+    while heap and len(found) < top_n:
+        neg_p, idx = heapq.heappop(heap)
+        found.append((tuple(sorted((order[list(idx)] + 1).tolist())), float(-neg_p)))
+        children = []
+        for t in range(k):
+            limit = idx[t + 1] if t + 1 < k else n
+            nxt = idx[:t] + (idx[t] + 1,) + idx[t + 1:]
+            if idx[t] + 1 < limit and nxt not in seen:
+                seen.add(nxt)
+                children.append(nxt)
+        if children:
+            probs = subset_probability(priors, order[np.array(children)] + 1)
+            for p, child in zip(probs.tolist(), children):
+                heapq.heappush(heap, (-p, child))
+    return found
+
+
+def number_masks(rows):
+    # One uint64 per row with bit n set for every number n in it.
+    bits = np.left_shift(np.uint64(1), rows.astype(np.uint64))
+    return np.bitwise_or.reduce(bits, axis=1) if rows.shape[1] else np.zeros(len(rows), dtype=np.uint64)
+
+
+_POPCOUNT_BYTE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def popcount(masks):
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(masks)
+    masks = np.ascontiguousarray(masks, dtype=np.uint64)
+    return _POPCOUNT_BYTE[masks.view(np.uint8)].reshape(masks.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+
+def draws_to_arrays(draws):
+    # Accepts DrawResults, a (main, star) pair of arrays or a list of ((main), (star)) tuples.
+    if isinstance(draws, DrawResults):
+        return draws.main, draws.star
+    if isinstance(draws, tuple) and len(draws) == 2 and isinstance(draws[0], np.ndarray):
+        return draws
+    draws = list(draws)
+    main = np.array([d[0] for d in draws], dtype=np.uint8).reshape(len(draws), 5)
+    star = np.array([d[1] for d in draws], dtype=np.uint8).reshape(len(draws), 2)
+    return main, star
+
+
+class DrawResults:
+    """Simulated draws stored as sorted uint8 columns, one row per draw.
+
+    Iterating or indexing yields ``((main), (star))`` tuples of ints, so code
+    written against the old list of tuples keeps working.
+    """
+
+    def __init__(self, main=None, star=None, main_range=50, star_range=12):
+        self.main = np.empty((0, 5), dtype=np.uint8) if main is None else main
+        self.star = np.empty((0, 2), dtype=np.uint8) if star is None else star
+        self.main_range = main_range
+        self.star_range = star_range
+
+    def __len__(self):
+        return len(self.main)
+
+    def __iter__(self):
+        return zip(map(tuple, self.main.tolist()), map(tuple, self.star.tolist()))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(zip(map(tuple, self.main[index].tolist()), map(tuple, self.star[index].tolist())))
+        return tuple(self.main[index].tolist()), tuple(self.star[index].tolist())
+
+    @property
+    def nbytes(self):
+        return self.main.nbytes + self.star.nbytes
+
+    def main_counts(self):
+        return np.bincount(self.main.ravel(), minlength=self.main_range + 1)[1:self.main_range + 1]
+
+    def star_counts(self):
+        return np.bincount(self.star.ravel(), minlength=self.star_range + 1)[1:self.star_range + 1]
+
+    def keys(self):
+        return encode_combos(self.main, self.star, self.main_range, self.star_range)
+
+    def combo_counts(self):
+        return np.unique(self.keys(), return_counts=True)
+
+
+class DrawTally:
+    """Per-number and per-combination counts folded from blocks of draws."""
+
+    def __init__(self, main_range=50, star_range=12):
+        self.main_range = main_range
+        self.star_range = star_range
+        self.draws = 0
+        self.main_counts = np.zeros(main_range, dtype=np.int64)
+        self.star_counts = np.zeros(star_range, dtype=np.int64)
+        self.main_pairs = np.zeros((main_range, main_range), dtype=np.int64)
+        self.star_pairs = np.zeros((star_range, star_range), dtype=np.int64)
+        self.main_triples = np.zeros(main_range ** 3, dtype=np.int64)
+        self._keys = np.empty(0, dtype=np.int64)
+        self._counts = np.empty(0, dtype=np.int64)
+        self._pending = []
+        self._pending_size = 0
+
+    def add(self, main, star):
+        block = DrawResults(main, star, self.main_range, self.star_range)
+        self.draws += len(block)
+        self.main_counts += block.main_counts()
+        self.star_counts += block.star_counts()
+        self.main_pairs += pair_counts(main, self.main_range)
+        self.star_pairs += pair_counts(star, self.star_range)
+        self.main_triples += triple_counts(main, self.main_range)
+        self._add_combos(block.keys(), np.ones(len(block), dtype=np.int64))
+        return self
+
+    def merge(self, other):
+        self._merge_numbers(other)
+        self._add_combos(*other.combo_counts())
+        return self
+
+    def _merge_numbers(self, other):
+        self.draws += other.draws
+        self.main_counts += other.main_counts
+        self.star_counts += other.star_counts
+        self.main_pairs += other.main_pairs
+        self.star_pairs += other.star_pairs
+        self.main_triples += other.main_triples
+
+    def combo_counts(self):
+        self._flush()
+        return self._keys, self._counts
+
+    def arrays(self):
+        # Everything needed to rebuild the tally with tally_from_arrays.
+        keys, counts = self.combo_counts()
+        return {'main_counts': self.main_counts, 'star_counts': self.star_counts,
+                'main_pairs': self.main_pairs, 'star_pairs': self.star_pairs,
+                'main_triples': self.main_triples, 'combo_keys': keys, 'combo_counts': counts}
+
+    def _add_combos(self, keys, counts):
+        # Buffer until the backlog is as large as the table, so merges stay
+        # amortised O(n log n) however many blocks are folded in.
+        self._pending.append((keys, counts))
+        self._pending_size += len(keys)
+        if self._pending_size >= max(len(self._keys), 16 * SAMPLE_BLOCK):
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        keys = np.concatenate([self._keys] + [k for k, _ in self._pending])
+        counts = np.concatenate([self._counts] + [c for _, c in self._pending])
+        self._keys, self._counts = merge_counts(keys, counts)
+        self._pending = []
+        self._pending_size = 0
+
+
+class SpaceSavingTally(DrawTally):
+    """DrawTally that keeps only the ``capacity`` heaviest combinations.
+
+    Uses mergeable Space-Saving summaries: each kept count overestimates the
+    true count by at most its recorded error, and no error exceeds
+    ``draws / capacity``. Any combination drawn more often than that is
+    guaranteed to be kept.
+    """
+
+    def __init__(self, capacity, main_range=50, star_range=12):
+        super().__init__(main_range, star_range)
+        self.capacity = capacity
+        self._errors = np.empty(0, dtype=np.int64)
+
+    @property
+    def max_error(self):
+        return self.draws // self.capacity
+
+    def floor(self):
+        # Largest count an unmonitored combination can have.
+        return int(self._counts.min()) if len(self._keys) >= self.capacity else 0
+
+    def merge(self, other):
+        self._merge_numbers(other)
+        self._merge_summary(other._keys, other._counts, other._errors, other.floor())
+        return self
+
+    def combo_counts(self):
+        return self._keys, self._counts
+
+    def combo_errors(self):
+        return self._errors
+
+    def arrays(self):
+        return {**super().arrays(), 'combo_errors': self._errors}
+
+    def _add_combos(self, keys, counts):
+        keys, counts = merge_counts(keys, counts)
+        self._merge_summary(keys, counts, np.zeros(len(keys), dtype=np.int64), 0)
+
+    def _merge_summary(self, keys, counts, errors, floor):
+        own_floor = self.floor()
+        union = np.union1d(self._keys, keys)
+        mine = np.searchsorted(union, self._keys)
+        theirs = np.searchsorted(union, keys)
+        est = np.full(len(union), own_floor + floor, dtype=np.int64)
+        err = est.copy()
+        est[mine] += self._counts - own_floor
+        err[mine] += self._errors - own_floor
+        est[theirs] += counts - floor
+        err[theirs] += errors - floor
+        if len(union) > self.capacity:
+            keep = np.sort(np.argpartition(-est, self.capacity - 1)[:self.capacity])
+            union, est, err = union[keep], est[keep], err[keep]
+        self._keys, self._counts, self._errors = union, est, err
+
+
+def make_tally(main_range=50, star_range=12, sketch_size=None):
+    if sketch_size:
+        return SpaceSavingTally(sketch_size, main_range, star_range)
+    return DrawTally(main_range, star_range)
+
+
+def tally_from_arrays(arrays, draws, main_range=50, star_range=12, sketch_size=None):
+    # Inverse of DrawTally.arrays; the arrays are used as given, so memory-mapped ones stay on disk.
+    tally = make_tally(main_range, star_range, sketch_size)
+    tally.draws = draws
+    for name in ('main_counts', 'star_counts', 'main_pairs', 'star_pairs', 'main_triples'):
+        setattr(tally, name, arrays[name])
+    tally._keys, tally._counts = arrays['combo_keys'], arrays['combo_counts']
+    if sketch_size:
+        tally._errors = arrays['combo_errors']
+    return tally
+
+
+def tally_blocks(plan, main_priors, star_priors, main_range, star_range, sketch_size=None):
+    tally = make_tally(main_range, star_range, sketch_size)
+    for seq, n in plan:
+        tally.add(*sample_block(seq, main_priors, star_priors, n))
+    return tally
+
+
+class ScenarioResults:
+    """Counts from run_scenarios, one row or top-N list per scenario."""
+
+    def __init__(self, draws, main_counts, star_counts, keys, counts, main_range=50, star_range=12):
+        self.draws = draws
+        self.main_counts = main_counts
+        self.star_counts = star_counts
+        self.main_range = main_range
+        self.star_range = star_range
+        # keys are scenario * n_combos + combo key, so each scenario is one sorted run
+        self._n_combos = math.comb(main_range, 5) * math.comb(star_range, 2)
+        self._keys = keys
+        self._counts = counts
+        self._bounds = np.searchsorted(keys, np.arange(len(main_counts) + 1) * self._n_combos)
+
+    def __len__(self):
+        return len(self.main_counts)
+
+    def combo_counts(self, scenario):
+        lo, hi = self._bounds[scenario], self._bounds[scenario + 1]
+        return self._keys[lo:hi] - scenario * self._n_combos, self._counts[lo:hi]
+
+    def get_top_combinations(self, top_n=5):
+        # One list per scenario, shaped like ABSEngine.get_top_combinations.
+        tops = []
+        for scenario in range(len(self)):
+            keys, counts = top_keys(*self.combo_counts(scenario), top_n)
+            main, star = decode_combos(keys, self.main_range, self.star_range)
+            tops.append([((tuple(m), tuple(s)), c) for m, s, c in zip(main.tolist(), star.tolist(), counts.tolist())])
+        return tops
+
+
+def run_scenarios(main_priors, star_priors, draws, seed=None, main_range=50, star_range=12, progress=None):
+    """Simulate ``draws`` tickets for every row of the prior stacks in one pass.
+
+    Scenario s uses main_priors[s] and star_priors[s]. Each block's
+    exponential race keys are drawn once and shared by all scenarios, so
+    differences between scenarios come from the priors rather than sampling
+    noise, and every scenario matches simulate_draws with the same seed.
+    """
+    main_priors, star_priors = np.atleast_2d(main_priors), np.atleast_2d(star_priors)
+    if len(main_priors) != len(star_priors):
+        raise ValueError("main_priors and star_priors need one row per scenario")
+    n_scenarios = len(main_priors)
+    offsets = np.arange(n_scenarios)
+    n_combos = math.comb(main_range, 5) * math.comb(star_range, 2)
+    main_counts = np.zeros(n_scenarios * main_range, dtype=np.int64)
+    star_counts = np.zeros(n_scenarios * star_range, dtype=np.int64)
+    rows = max(1, SCENARIO_CHUNK // (n_scenarios * main_range))
+    keys = counts = np.empty(0, dtype=np.int64)
+    pending = []
+    done = 0
+    for seq, n in block_plan(draws, seed):
+        rng = np.random.default_rng(seq)
+        main_race = rng.standard_exponential((n, main_range))
+        star_race = rng.standard_exponential((n, star_range))
+        for lo in range(0, n, rows):
+            with np.errstate(divide='ignore'):
+                main = race_winners(main_race[None, lo:lo + rows] / main_priors[:, None], 5)
+                star = race_winners(star_race[None, lo:lo + rows] / star_priors[:, None], 2)
+            main_counts += np.bincount((main + (offsets * main_range - 1)[:, None, None].astype(np.intp)).ravel(),
+                                       minlength=n_scenarios * main_range)
+            star_counts += np.bincount((star + (offsets * star_range - 1)[:, None, None].astype(np.intp)).ravel(),
+                                       minlength=n_scenarios * star_range)
+            block_keys = encode_combos(main.reshape(-1, 5), star.reshape(-1, 2), main_range, star_range)
+            pending.append(block_keys + np.repeat(offsets * n_combos, main.shape[1]))
+            # Merge once the backlog is as large as the table, as in DrawTally
+            if sum(map(len, pending)) >= max(len(keys), 16 * SAMPLE_BLOCK):
+                keys, counts = merge_counts(np.concatenate([keys] + pending),
+                                            np.concatenate([counts] + [np.ones(len(p), np.int64) for p in pending]))
+                pending = []
+        done += n
+        if progress:
+            progress(done, draws)
+    keys, counts = merge_counts(np.concatenate([keys] + pending),
+                                np.concatenate([counts] + [np.ones(len(p), np.int64) for p in pending]))
+    return ScenarioResults(draws, main_counts.reshape(n_scenarios, main_range),
+                           star_counts.reshape(n_scenarios, star_range), keys, counts, main_range, star_range)
+
+
+class PriorState:
+    """Running number weights behind the priors, updated one draw at a time.
+
+    ``mode`` is 'all' (every draw weighs the same), 'decay' (each new draw
+    scales older weights by ``decay``) or 'window' (only the last ``window``
+    draws count). Priors are the smoothed, normalised weights. Numbers
+    outside 1..range are ignored.
+    """
+
+    def __init__(self, main_range=50, star_range=12, mode='all', decay=0.99, window=None, smoothing=1.0):
+        if mode not in ('all', 'decay', 'window'):
+            raise ValueError(f"Unknown prior mode: {mode!r}")
+        if mode == 'window' and not window:
+            raise ValueError("Window mode needs a window length")
+        self.mode = mode
+        self.decay = decay
+        self.window = window
+        self.smoothing = smoothing
+        self.main_weights = np.zeros(main_range)
+        self.star_weights = np.zeros(star_range)
+        self._recent = deque()
+
+    def update(self, main, star):
+        main, star = np.asarray(main, dtype=np.intp) - 1, np.asarray(star, dtype=np.intp) - 1
+        main = main[(main >= 0) & (main < self.main_weights.size)]
+        star = star[(star >= 0) & (star < self.star_weights.size)]
+        if self.mode == 'decay':
+            self.main_weights *= self.decay
+            self.star_weights *= self.decay
+        self.main_weights[main] += 1
+        self.star_weights[star] += 1
+        if self.mode == 'window':
+            self._recent.append((main, star))
+            if len(self._recent) > self.window:
+                old_main, old_star = self._recent.popleft()
+                self.main_weights[old_main] -= 1
+                self.star_weights[old_star] -= 1
+        return self
+
+    def extend(self, main, star):
+        # Bulk equivalent of calling update on each row in order.
+        main = np.asarray(main, dtype=np.intp) - 1
+        star = np.asarray(star, dtype=np.intp) - 1
+        main_ok = (main >= 0) & (main < self.main_weights.size)
+        star_ok = (star >= 0) & (star < self.star_weights.size)
+        if self.mode == 'window':
+            main, star = main[-self.window:], star[-self.window:]
+            main_ok, star_ok = main_ok[-self.window:], star_ok[-self.window:]
+            self._recent.extend((m[m_ok], s[s_ok]) for m, m_ok, s, s_ok in zip(main, main_ok, star, star_ok))
+            while len(self._recent) > self.window:
+                old_main, old_star = self._recent.popleft()
+                self.main_weights[old_main] -= 1
+                self.star_weights[old_star] -= 1
+        age_weights = np.ones(len(main))
+        if self.mode == 'decay':
+            self.main_weights *= self.decay ** len(main)
+            self.star_weights *= self.decay ** len(main)
+            age_weights = self.decay ** np.arange(len(main) - 1, -1, -1, dtype=np.float64)
+        # Out-of-range numbers are counted at index 0 with no weight
+        self.main_weights += np.bincount(np.where(main_ok, main, 0).ravel(), (age_weights[:, None] * main_ok).ravel(),
+                                         minlength=self.main_weights.size)
+        self.star_weights += np.bincount(np.where(star_ok, star, 0).ravel(), (age_weights[:, None] * star_ok).ravel(),
+                                         minlength=self.star_weights.size)
+        return self
+
+    def priors(self):
+        main = self.main_weights + self.smoothing
+        star = self.star_weights + self.smoothing
+        return main / main.sum(), star / star.sum()
+
+
+def peak_rss_bytes():
+    # Peak resident set size of this process so far, or None where unsupported.
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class RunStats:
+    """Wall time of the latest call to each engine phase, plus run size.
+
+    Phases are 'priors', 'sample', 'tally', 'top_n' and 'score'; callers may
+    time their own (CSV parsing, chart rendering) with ``phase``. ``hook``,
+    if set, is called as hook(phase, seconds) whenever one is recorded.
+    ``peak_rss_bytes`` is the whole process's peak as of the last run, so in
+    a long-lived server it bounds that run rather than measuring it.
+    """
+
+    def __init__(self, hook=None):
+        self.hook = hook
+        self.phases = {}
+        self.draws = 0
+        self.result_bytes = 0
+        self.peak_rss_bytes = None
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        self.phases[name] = seconds
+        if self.hook:
+            self.hook(name, seconds)
+
+    @property
+    def draws_per_second(self):
+        seconds = self.phases.get('sample', 0.0) + self.phases.get('tally', 0.0)
+        return self.draws / seconds if seconds else None
+
+    def as_dict(self):
+        return {
+            'phases': dict(self.phases),
+            'draws': self.draws,
+            'draws_per_second': self.draws_per_second,
+            'result_bytes': self.result_bytes,
+            'peak_rss_bytes': self.peak_rss_bytes,
+        }
+
+
+class SimulationCancelled(Exception):
+    pass
+
+
+class SimulationJob:
+    """An engine run on a background executor, polled rather than awaited.
+
+    ``method`` is the engine method to run (simulate_draws,
+    simulate_adaptive, ...). Its progress callback keeps ``draws_done``
+    current and checks for cancel(), which stops the run at the next block.
+    """
+
+    def __init__(self, engine, executor, method='simulate_draws', **kwargs):
+        self.engine = engine
+        self.draws_done = 0
+        self.draws_total = engine.draws
+        self._started = threading.Event()
+        self._cancelled = threading.Event()
+        self._future = executor.submit(self._run, getattr(engine, method), kwargs)
+
+    def _run(self, run, kwargs):
+        self._started.set()
+        if self._cancelled.is_set():
+            raise SimulationCancelled()
+        run(progress=self._progress, **kwargs)
+        return self.engine
+
+    def _progress(self, done, total):
+        self.draws_done = done
+        if self._cancelled.is_set():
+            raise SimulationCancelled()
+
+    def cancel(self):
+        self._cancelled.set()
+        self._future.cancel()
+
+    @property
+    def status(self):
+        # 'queued', 'running', 'done', 'cancelled' or 'failed'
+        if self._future.cancelled():
+            return 'cancelled'
+        if not self._future.done():
+            return 'running' if self._started.is_set() else 'queued'
+        error = self._future.exception()
+        if isinstance(error, SimulationCancelled):
+            return 'cancelled'
+        return 'failed' if error else 'done'
+
+    @property
+    def fraction(self):
+        return min(self.draws_done / max(self.draws_total, 1), 1.0)
+
+    def result(self, timeout=None):
+        # The engine once the run has finished; re-raises the run's error, if any.
+        return self._future.result(timeout)
+
+
+class LRUCache:
+    """Mapping that keeps the ``max_entries`` most recently used items."""
+
+    def __init__(self, max_entries=8):
+        self.max_entries = max_entries
+        self._items = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        if key not in self._items:
+            return default
+        self._items.move_to_end(key)
+        return self._items[key]
+
+    def put(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_entries:
+            self._items.popitem(last=False)
+        return value
+
 
 class ABSEngine:
-    def __init__(self, main_range=50, star_range=12, draws=100000):
+    def __init__(self, main_range=50, star_range=12, draws=100000, seed=None, sketch_size=None,
+                 prior_mode='all', decay=0.99, window=None):
         self.main_range = main_range
         self.star_range = star_range
         self.draws = draws
+        self.seed = seed
+        self.prior_state = PriorState(main_range, star_range, prior_mode, decay, window)
+        # When set, combinations are counted approximately in a fixed-size
+        # Space-Saving summary and raw draws are not kept.
+        self.sketch_size = sketch_size
         self.main_priors = np.ones(main_range) / main_range
         self.star_priors = np.ones(star_range) / star_range
-        self.results = []
+        self.history = DrawResults(main_range=main_range, star_range=star_range)
+        self.results = DrawResults(main_range=main_range, star_range=star_range)
+        self.tally = None
+        # Per-number frequencies of the last simulation, kept up to date while it runs
+        self.main_counts = np.zeros(main_range, dtype=np.int64)
+        self.star_counts = np.zeros(star_range, dtype=np.int64)
+        self._cooccurrence = {}
+        # Why the last simulate_adaptive ended: 'stable', 'futile' (stopped early) or None
+        self.stop_reason = None
+        self.stats = RunStats()
+
+    @contextmanager
+    def instrument(self, hook=None):
+        # Fresh stats for the enclosed calls: with engine.instrument() as stats: ...
+        self.stats = RunStats(hook)
+        yield self.stats
 
     def load_draw_history(self, df):
-        balls = df[[f'Ball {i}' for i in range(1,6)]].values.flatten()
-        stars = df[[f'Lucky Star {i}' for i in range(1,3)]].values.flatten()
+        with self.stats.phase('priors'):
+            self.history = DrawResults(*history_arrays(df, self.main_range, self.star_range),
+                                       self.main_range, self.star_range)
+            self._cooccurrence = {}
+            state = self.prior_state
+            self.prior_state = PriorState(self.main_range, self.star_range, state.mode, state.decay,
+                                          state.window, state.smoothing)
+            self.prior_state.extend(self.history.main, self.history.star)
+            self.main_priors, self.star_priors = self.prior_state.priors()
+
+    def submit(self, executor, method='simulate_draws', **kwargs):
+        # Start method(**kwargs) on executor; see SimulationJob.
+        return SimulationJob(self, executor, method, **kwargs)
+
+    def update_with_draw(self, draw):
+        # Fold in one new ((main), (star)) result without re-reading the history.
+        self.prior_state.update(*draw)
+        self.main_priors, self.star_priors = self.prior_state.priors()
+
+    def simulate_draws(self, workers=None, stream=False, progress=None):
+        # progress, if given, is called as progress(draws_done, draws_total).
+        plan = block_plan(self.draws, self.seed)
+        self._cooccurrence = {}
+        if workers and workers > 1:
+            return self._simulate_parallel(plan, workers, progress)
+        if stream or self.sketch_size:
+            for done, total in self.stream_draws():
+                if progress:
+                    progress(done, total)
+            return
+        main = np.empty((self.draws, 5), dtype=np.uint8)
+        star = np.empty((self.draws, 2), dtype=np.uint8)
+        self.main_counts = np.zeros(self.main_range, dtype=np.int64)
+        self.star_counts = np.zeros(self.star_range, dtype=np.int64)
+        lo = 0
+        sample_time = tally_time = 0.0
+        for seq, n in plan:
+            start = time.perf_counter()
+            block = DrawResults(*sample_block(seq, self.main_priors, self.star_priors, n),
+                                self.main_range, self.star_range)
+            main[lo:lo + n], star[lo:lo + n] = block.main, block.star
+            sampled = time.perf_counter()
+            self.main_counts += block.main_counts()
+            self.star_counts += block.star_counts()
+            sample_time += sampled - start
+            tally_time += time.perf_counter() - sampled
+            lo += n
+            if progress:
+                progress(lo, self.draws)
+        self.results = DrawResults(main, star, self.main_range, self.star_range)
+        self.tally = None
+        self._finish_run(sample_time, tally_time)
 
-        ball_counts = Counter(balls)
-        star_counts = Counter(stars)
+    def prior_scenarios(self, settings):
+        """Stacked (main, star) priors fitted on the loaded history, one row per setting.
 
-        self.main_priors = np.array([ball_counts.get(i+1, 0)+1 for i in range(self.main_range)])
-        self.main_priors = self.main_priors / self.main_priors.sum()
+        Each setting is a dict of PriorState options (mode, decay, window,
+        smoothing; the engine's own are the defaults) and may name a
+        'history' slice of the draws to fit on.
+        """
+        state = self.prior_state
+        defaults = {'mode': state.mode, 'decay': state.decay, 'window': state.window, 'smoothing': state.smoothing}
+        main_priors, star_priors = [], []
+        for setting in settings:
+            setting = dict(setting)
+            subset = setting.pop('history', slice(None))
+            scenario = PriorState(self.main_range, self.star_range, **{**defaults, **setting})
+            scenario.extend(self.history.main[subset], self.history.star[subset])
+            main, star = scenario.priors()
+            main_priors.append(main)
+            star_priors.append(star)
+        return np.array(main_priors), np.array(star_priors)
 
-        self.star_priors = np.array([star_counts.get(i+1, 0)+1 for i in range(self.star_range)])
-        self.star_priors = self.star_priors / self.star_priors.sum()
+    def simulate_scenarios(self, main_priors, star_priors, progress=None):
+        # self.draws tickets from self.seed for each row of the prior stacks; see run_scenarios.
+        with self.stats.phase('scenarios'):
+            return run_scenarios(main_priors, star_priors, self.draws, self.seed, self.main_range,
+                                 self.star_range, progress)
 
-    def simulate_draws(self):
-        simulations = []
-        for _ in range(self.draws):
-            main = np.random.choice(range(1, self.main_range+1), size=5, replace=False, p=self.main_priors)
-            star = np.random.choice(range(1, self.star_range+1), size=2, replace=False, p=self.star_priors)
-            simulations.append((tuple(sorted(main)), tuple(sorted(star))))
-        self.results = simulations
+    def stream_draws(self):
+        # Fold each block into self.tally and drop it; yields (draws_done, draws_total).
+        self.results = DrawResults(main_range=self.main_range, star_range=self.star_range)
+        self.tally = make_tally(self.main_range, self.star_range, self.sketch_size)
+        self._cooccurrence = {}
+        self.main_counts, self.star_counts = self.tally.main_counts, self.tally.star_counts
+        sample_time = tally_time = 0.0
+        try:
+            for seq, n in block_plan(self.draws, self.seed):
+                start = time.perf_counter()
+                block = sample_block(seq, self.main_priors, self.star_priors, n)
+                sampled = time.perf_counter()
+                self.tally.add(*block)
+                sample_time += sampled - start
+                tally_time += time.perf_counter() - sampled
+                yield self.tally.draws, self.draws
+        finally:
+            self._finish_run(sample_time, tally_time)
+
+    def _simulate_parallel(self, plan, workers, progress=None):
+        # Each worker gets a contiguous run of blocks and sends back only its
+        # counts; the blocks' seeds don't depend on the split, so neither do the totals.
+        splits = [part.tolist() for part in np.array_split(np.arange(len(plan)), workers) if len(part)]
+        tally = make_tally(self.main_range, self.star_range, self.sketch_size)
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=len(splits)) as pool:
+            futures = [pool.submit(tally_blocks, [plan[i] for i in part], self.main_priors,
+                                   self.star_priors, self.main_range, self.star_range, self.sketch_size)
+                       for part in splits]
+            for future in as_completed(futures):
+                tally.merge(future.result())
+                if progress:
+                    progress(tally.draws, self.draws)
+        self.results = DrawResults(main_range=self.main_range, star_range=self.star_range)
+        self.tally = tally
+        self.main_counts, self.star_counts = tally.main_counts, tally.star_counts
+        # Workers sample and tally together; their wall time is booked as sampling
+        self._finish_run(time.perf_counter() - start, 0.0)
+
+    def _finish_run(self, sample_time, tally_time):
+        self.stats.record('sample', sample_time)
+        self.stats.record('tally', tally_time)
+        self.stats.draws = self.draws_used
+        self.stats.result_bytes = self.results.nbytes
+        if self.tally is not None:
+            keys, counts = self.tally.combo_counts()
+            self.stats.result_bytes += keys.nbytes + counts.nbytes
+        self.stats.peak_rss_bytes = peak_rss_bytes()
+
+    @property
+    def draws_used(self):
+        return self.tally.draws if self.tally is not None else len(self.results)
+
+    def simulate_adaptive(self, top_n=10, confidence=0.95, tolerance=0.1, growth=1.25, progress=None):
+        """Stream draws until the top_n frequencies are pinned down, at most self.draws.
+
+        Checked whenever the draw count has grown by ``growth``. The run is
+        'stable' once the n-th count's Wilson interval at ``confidence`` is
+        within ``tolerance`` of its frequency (higher counts are tighter
+        still). Near-tied tickets never separate, so the rule is on
+        precision, not on the order. The run is 'futile' when even an
+        optimistic projection of that count to self.draws would not get
+        there: the top_n is sampling noise and more draws will not change
+        that. stop_reason records which, if either; draws_used how many
+        draws were run. Returns whether the top_n is stable.
+        """
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        self.stop_reason = None
+        if self.draws <= SAMPLE_BLOCK:
+            # One block: nothing to stop early, so keep the faster in-memory run
+            self.simulate_draws(progress=progress)
+        else:
+            next_check = SAMPLE_BLOCK
+            for done, total in self.stream_draws():
+                if progress:
+                    progress(done, total)
+                if done < next_check and done < total:
+                    continue
+                count = self.top_count(top_n)
+                if count_is_precise(count, done, z, tolerance):
+                    break
+                # Linear growth from an upper bound on the current rate
+                projected = (count + z * math.sqrt(count)) * total / done
+                if done < total and not count_is_precise(projected, total, z, tolerance):
+                    self.stop_reason = 'futile'
+                    return False
+                next_check = done * growth
+        if count_is_precise(self.top_count(top_n), self.draws_used, z, tolerance):
+            self.stop_reason = 'stable'
+            return True
+        return False
+
+    def top_count(self, top_n):
+        # Count of the top_n-th most frequent combination, 0 if fewer were drawn.
+        _, counts = top_keys(*self.combo_counts(), top_n)
+        return int(counts[-1]) if len(counts) == top_n else 0
+
+    def top_frequency_intervals(self, top_n=5, confidence=0.95):
+        # (combo, count, low, high): Wilson interval on each top combo's per-draw frequency.
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        n = max(self.draws_used, 1)
+        return [(combo, count, *wilson_interval(count, n, z)) for combo, count in self.get_top_combinations(top_n)]
+
+    def cooccurrence(self, source='simulated', kind='main'):
+        """(n, n) matrix of how often two numbers are drawn together.
+
+        ``source`` is 'simulated' or 'history', ``kind`` 'main' or 'star'; the
+        diagonal holds single-number counts. Cached until the next run or load.
+        """
+        key = ('pairs', source, kind)
+        if key not in self._cooccurrence:
+            if source == 'simulated' and self.tally is not None:
+                matrix = self.tally.main_pairs if kind == 'main' else self.tally.star_pairs
+            else:
+                draws = self._draws_from(source)
+                if kind == 'main':
+                    matrix = pair_counts(draws.main, self.main_range)
+                else:
+                    matrix = pair_counts(draws.star, self.star_range)
+            self._cooccurrence[key] = matrix
+        return self._cooccurrence[key]
+
+    def triple_cooccurrence(self, source='simulated'):
+        # Main-ball triples seen at least once, as (m, 3) uint8 numbers and counts.
+        key = ('triples', source)
+        if key not in self._cooccurrence:
+            if source == 'simulated' and self.tally is not None:
+                counts = self.tally.main_triples
+            else:
+                counts = triple_counts(self._draws_from(source).main, self.main_range)
+            self._cooccurrence[key] = sparse_triples(counts, self.main_range)
+        return self._cooccurrence[key]
+
+    def _draws_from(self, source):
+        if source not in ('simulated', 'history'):
+            raise ValueError(f"Unknown draw source: {source!r}")
+        return self.results if source == 'simulated' else self.history
+
+    def combo_counts(self):
+        if self.tally is not None:
+            return self.tally.combo_counts()
+        return self.results.combo_counts()
 
     def get_top_combinations(self, top_n=5):
-        from collections import Counter
-        counts = Counter(self.results)
-        return counts.most_common(top_n)
+        with self.stats.phase('top_n'):
+            keys, counts = top_keys(*self.combo_counts(), top_n)
+            return self.decode_top(keys, counts)
+
+    def get_top_combination_bounds(self, top_n=5):
+        # (combo, count, error): the true count lies in [count - error, count].
+        keys, counts = self.combo_counts()
+        if isinstance(self.tally, SpaceSavingTally):
+            errors = self.tally.combo_errors()
+        else:
+            errors = np.zeros(len(keys), dtype=np.int64)
+        top, top_counts = top_keys(keys, counts, top_n)
+        top_errors = errors[np.searchsorted(keys, top)]
+        return [(combo, count, error) for (combo, count), error
+                in zip(self.decode_top(top, top_counts), top_errors.tolist())]
+
+    def combination_probability(self, main, star):
+        # Exact model probability of a ticket, or of each row if given arrays of tickets.
+        p = subset_probability(self.main_priors, main) * subset_probability(self.star_priors, star)
+        return float(p[0]) if np.ndim(main) == 1 else p
+
+    def get_top_probable(self, top_n=5):
+        """Exact top_n tickets under the priors, as ((main), (star)), probability.
+
+        No simulation: the best main sets and star pairs are found by
+        best-first search, then merged the same way over their product.
+        """
+        mains = top_subsets(self.main_priors, 5, top_n)
+        stars = top_subsets(self.star_priors, 2, top_n)
+        if not mains or not stars:
+            return []
+        heap = [(-mains[0][1] * stars[0][1], 0, 0)]
+        seen = {(0, 0)}
+        found = []
+        while heap and len(found) < top_n:
+            neg_p, i, j = heapq.heappop(heap)
+            found.append(((mains[i][0], stars[j][0]), -neg_p))
+            for a, b in ((i + 1, j), (i, j + 1)):
+                if a < len(mains) and b < len(stars) and (a, b) not in seen:
+                    seen.add((a, b))
+                    heapq.heappush(heap, (-mains[a][1] * stars[b][1], a, b))
+        return found
+
+    def backtest(self, **kwargs):
+        # Walk-forward backtest over the loaded history; see abs_backtest.walk_forward.
+        from abs_backtest import walk_forward
+        return walk_forward(self, **kwargs)
+
+    def portfolio(self, **kwargs):
+        # k tickets maximising the chance of at least one win; see abs_portfolio.optimise_portfolio.
+        from abs_portfolio import optimise_portfolio
+        return optimise_portfolio(self, **kwargs)
+
+    def decode_top(self, keys, counts):
+        main, star = decode_combos(keys, self.main_range, self.star_range)
+        return [((tuple(m), tuple(s)), c) for m, s, c in zip(main.tolist(), star.tolist(), counts.tolist())]
 
     def evaluate_prediction(self, prediction, actual):
         main_hit = len(set(prediction[0]) & set(actual[0]))
         star_hit = len(set(prediction[1]) & set(actual[1]))
         return main_hit, star_hit
 
-    def score_all_predictions(self, actual_draws):
-        scores = []
-        for pred in self.results:
-            for actual in actual_draws:
-                scores.append(self.evaluate_prediction(pred, actual))
-        return scores
+    def score_all_predictions(self, actual_draws, predictions=None, aggregate=False, chunk_pairs=SCORE_CHUNK):
+        """Hit counts of every prediction against every actual draw.
+
+        Returns a (n_pred, n_actual, 2) uint8 array of (main hits, star hits),
+        or with ``aggregate=True`` a (6, 3) matrix counting the pairs that hit
+        each (main, star) tier. Predictions default to the simulated draws.
+        """
+        with self.stats.phase('score'):
+            return self._score(actual_draws, predictions, aggregate, chunk_pairs)
+
+    def _score(self, actual_draws, predictions, aggregate, chunk_pairs):
+        if predictions is None and not len(self.results):
+            raise ValueError("No simulated draws kept; run simulate_draws without a sketch or streaming "
+                             "first, or pass predictions")
+        pred_main, pred_star = draws_to_arrays(self.results if predictions is None else predictions)
+        act_main, act_star = draws_to_arrays(actual_draws)
+        pred_m, pred_s = number_masks(pred_main), number_masks(pred_star)
+        act_m, act_s = number_masks(act_main), number_masks(act_star)
+        n_main, n_star = pred_main.shape[1] + 1, pred_star.shape[1] + 1
+        if aggregate:
+            scores = np.zeros(n_main * n_star, dtype=np.int64)
+        else:
+            scores = np.empty((len(pred_m), len(act_m), 2), dtype=np.uint8)
+        step = max(1, chunk_pairs // max(1, len(act_m)))
+        for lo in range(0, len(pred_m), step):
+            main_hit = popcount(pred_m[lo:lo + step, None] & act_m[None, :])
+            star_hit = popcount(pred_s[lo:lo + step, None] & act_s[None, :])
+            if aggregate:
+                tier = main_hit * np.uint8(n_star) + star_hit
+                scores += np.bincount(tier.ravel(), minlength=n_main * n_star)
+            else:
+                scores[lo:lo + step, :, 0] = main_hit
+                scores[lo:lo + step, :, 1] = star_hit
+        return scores.reshape(n_main, n_star) if aggregate else scores
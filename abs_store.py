@@ -0,0 +1,122 @@
+# abs_store.py
+# On-disk store of simulation runs, one directory of .npy files per run
+
+import json
+import os
+import shutil
+import uuid
+from datetime import datetime
+
+import numpy as np
+
+from abs_engine import ABSEngine, DrawResults, make_tally, tally_from_arrays
+
+DEFAULT_ROOT = os.environ.get('EASY_DREAM_RUNS', 'runs')
+
+
+class RunStore:
+    """Simulation runs saved under ``root``, one directory per run.
+
+    A run is its tally arrays, priors and (when the engine kept them) raw
+    draws as .npy files, plus a meta.json. Runs reopen with
+    ``np.load(mmap_mode='r')``, so multi-million-draw runs load without
+    being read into memory. With ``max_runs`` set, saving a run deletes
+    the oldest ones beyond that many.
+    """
+
+    def __init__(self, root=DEFAULT_ROOT, max_runs=None):
+        self.root = root
+        self.max_runs = max_runs
+
+    def save(self, engine, **meta):
+        # Returns the new run's id; keyword arguments are kept in its metadata.
+        created = datetime.now()
+        run_id = f"{created:%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+        tally = engine.tally
+        if tally is None:
+            tally = make_tally(engine.main_range, engine.star_range).add(engine.results.main, engine.results.star)
+        arrays = {**tally.arrays(), 'main_priors': engine.main_priors, 'star_priors': engine.star_priors}
+        if len(engine.results):
+            arrays.update(main=engine.results.main, star=engine.results.star)
+        meta = {'run_id': run_id, 'created': created.isoformat(timespec='seconds'), 'draws': tally.draws,
+                'seed': engine.seed, 'main_range': engine.main_range, 'star_range': engine.star_range,
+                'sketch_size': engine.sketch_size, **meta}
+
+        # Written under a temporary name and renamed, so a half-written run is never listed
+        os.makedirs(self.root, exist_ok=True)
+        tmp = os.path.join(self.root, f".{run_id}.tmp")
+        os.makedirs(tmp)
+        try:
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp, f"{name}.npy"), np.asarray(array))
+            with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+                json.dump(meta, f, indent=2, default=str)
+            os.rename(tmp, os.path.join(self.root, run_id))
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        if self.max_runs is not None:
+            self.prune(self.max_runs)
+        return run_id
+
+    def prune(self, keep):
+        # Deletes all but the newest ``keep`` runs; returns the deleted ids.
+        run_ids = [meta['run_id'] for meta in self.runs()]
+        stale = run_ids[:max(len(run_ids) - keep, 0)]
+        for run_id in stale:
+            shutil.rmtree(os.path.join(self.root, run_id), ignore_errors=True)
+        return stale
+
+    def runs(self):
+        # Metadata of every saved run, oldest first.
+        if not os.path.isdir(self.root):
+            return []
+        metas = []
+        for name in sorted(os.listdir(self.root)):
+            path = os.path.join(self.root, name, 'meta.json')
+            if not name.startswith('.') and os.path.isfile(path):
+                with open(path) as f:
+                    metas.append(json.load(f))
+        return metas
+
+    def load(self, run_id, mmap=True):
+        """The saved run as an ABSEngine, as it was after simulating.
+
+        With ``mmap`` the draw and count arrays are read-only memory maps of
+        the files, so only the pages a query touches are read.
+        """
+        path = os.path.join(self.root, run_id)
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        arrays = {name[:-4]: np.load(os.path.join(path, name), mmap_mode='r' if mmap else None)
+                  for name in os.listdir(path) if name.endswith('.npy')}
+        tally = tally_from_arrays(arrays, meta['draws'], meta['main_range'], meta['star_range'],
+                                  meta['sketch_size'])
+        engine = _engine(tally, arrays['main_priors'], arrays['star_priors'], meta['seed'], meta['sketch_size'])
+        if 'main' in arrays:
+            engine.results = DrawResults(arrays['main'], arrays['star'], engine.main_range, engine.star_range)
+        return engine
+
+    def combine(self, run_ids):
+        """One engine whose tally pools the given runs.
+
+        Pooling only makes sense for runs simulated from the same priors;
+        the first run's priors are kept. Sketched runs pool as upper bounds.
+        """
+        engines = [self.load(run_id) for run_id in run_ids]
+        first = engines[0]
+        tally = make_tally(first.main_range, first.star_range)
+        for engine in engines:
+            tally.merge(engine.tally)
+        return _engine(tally, first.main_priors, first.star_priors)
+
+    def delete(self, run_id):
+        shutil.rmtree(os.path.join(self.root, run_id))
+
+
+def _engine(tally, main_priors, star_priors, seed=None, sketch_size=None):
+    engine = ABSEngine(tally.main_range, tally.star_range, draws=tally.draws, seed=seed, sketch_size=sketch_size)
+    engine.main_priors, engine.star_priors = main_priors, star_priors
+    engine.tally = tally
+    engine.main_counts, engine.star_counts = tally.main_counts, tally.star_counts
+    return engine
@@ -1,13 +1,24 @@
 # streamlit_app.py (Complete Ultimate Version)
 
+import hashlib
+import io
+import os
+import time
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
-from abs_engine import ABSEngine
+from abs_engine import ABSEngine, LRUCache, read_draw_history
+from abs_store import RunStore
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import plotly.express as px
-import plotly.graph_objects as go
+
+# Wall-time budget (seconds) for a session's first script run and for later reruns;
+# abs_benchmark.py --dashboard tracks the same numbers.
+STARTUP_BUDGET = 3.0
+RERUN_BUDGET = 0.5
+# Saved runs kept on disk; older ones are deleted as new runs are saved.
+SAVED_RUNS_LIMIT = 20
+script_start = time.perf_counter()
 
 # Page Configuration
 st.set_page_config(
@@ -119,6 +130,20 @@ with st.sidebar:
         help="Statistical confidence for predictions"
     )
     
+    adaptive_stop = st.checkbox(
+        "⏱️ Stop early once the Top 10 is stable",
+        value=False,
+        help="Simulate in batches and stop once the Top 10 frequencies are known to within 10% at the "
+             "confidence level, or as soon as it is clear they never will be"
+    )
+    
+    save_runs = st.checkbox(
+        "💾 Save runs to disk",
+        value=False,
+        help=f"Keep each run's draws and counts on disk so the History view can reopen it later "
+             f"(the newest {SAVED_RUNS_LIMIT} runs are kept)"
+    )
+    
     view_option = st.radio(
         "View Mode", 
         ["🎯 Predictions", "🔬 Scientific View", "📊 Analytics", "📈 History"],
@@ -138,14 +163,334 @@ with st.sidebar:
         st.session_state.simulation_history = []
         st.success("History cleared!")
 
+# Cached Data Loading and Simulation
+@st.cache_data(max_entries=16, show_spinner=False)
+def load_history(data):
+    # Keyed on the upload's bytes, so an unchanged file is parsed once
+    engine = ABSEngine(main_range=50, star_range=12)
+    with engine.stats.phase('parse'):
+        df = read_draw_history(io.BytesIO(data))
+    engine.load_draw_history(df)
+    return (hashlib.sha256(data).hexdigest(), df, engine.main_priors, engine.star_priors,
+            engine.cooccurrence('history'), engine.stats.phases)
+
+
+@st.cache_resource
+def job_executor():
+    # Shared by every session: simulations queue here instead of holding script threads
+    return ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix='abs-simulation')
+
+
+def simulation_job(data_hash, draws, confidence, seed, main_priors, star_priors):
+    # Jobs are kept per session, keyed on (data hash, draws, confidence, seed), so
+    # reruns and view changes poll or reuse the same run instead of restarting it.
+    # A confidence means adaptive stopping; None runs all draws.
+    if 'simulation_cache' not in st.session_state:
+        st.session_state.simulation_cache = LRUCache(max_entries=4)
+    cache = st.session_state.simulation_cache
+    key = (data_hash, draws, confidence, seed)
+    if key not in cache:
+        engine = ABSEngine(main_range=50, star_range=12, draws=draws, seed=seed)
+        engine.main_priors, engine.star_priors = main_priors, star_priors
+        if confidence:
+            job = engine.submit(job_executor(), 'simulate_adaptive', top_n=10, confidence=confidence / 100)
+        else:
+            job = engine.submit(job_executor())
+        cache.put(key, job)
+    return cache.get(key)
+
+
+@st.fragment(run_every=0.5)
+def job_progress(job):
+    # Polls the running job without rerunning the page; once it stops, a full rerun shows the results.
+    if job.status in ('queued', 'running'):
+        if job.status == 'queued':
+            text = "⏳ Waiting for a free simulation worker..."
+        else:
+            text = f"🔄 Running Advanced Bayesian Simulation... {job.draws_done:,} of {job.draws_total:,} draws"
+        st.progress(job.fraction, text=text)
+        if st.button("⏹️ Cancel Simulation"):
+            job.cancel()
+    else:
+        st.rerun()
+
+def show_saved_runs():
+    # Past runs reopen from disk (memory-mapped); several selected runs are pooled.
+    st.markdown("## 💾 Saved Runs")
+    runs = run_store.runs()
+    if not runs:
+        st.info("No saved runs yet. Run a simulation with 'Save runs to disk' enabled.")
+        return
+    table = pd.DataFrame(runs).reindex(columns=['run_id', 'created', 'draws', 'confidence', 'data_hash'])
+    # Runs saved by abs_cli.py have no data hash
+    table['data_hash'] = table['data_hash'].astype('string').str[:12]
+    st.dataframe(table.iloc[::-1], hide_index=True)
+    
+    selected = st.multiselect(
+        "Reopen runs",
+        table['run_id'].iloc[::-1].tolist(),
+        default=[runs[-1]['run_id']],
+        help="Selecting several runs pools their counts into one tally"
+    )
+    if not selected:
+        return
+    if len({run.get('data_hash') for run in runs if run['run_id'] in selected}) > 1:
+        st.warning("⚠️ The selected runs were simulated from different draw histories.")
+    
+    if 'saved_run_cache' not in st.session_state:
+        st.session_state.saved_run_cache = LRUCache(max_entries=4)
+    cache = st.session_state.saved_run_cache
+    key = tuple(selected)
+    if key not in cache:
+        cache.put(key, run_store.load(selected[0]) if len(selected) == 1 else run_store.combine(selected))
+    engine = cache.get(key)
+    
+    st.metric("Pooled Simulations", f"{engine.draws_used:,}")
+    st.write("**Top 10 Results:**")
+    for j, ((main, star), count) in enumerate(engine.get_top_combinations(top_n=10), 1):
+        st.write(f"#{j}: {list(main)} ⭐ {list(star)} (Frequency: {count:,})")
+
+def figure_png(fig):
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', bbox_inches='tight')
+    return buffer.getvalue()
+
+
+# Charts are cached as PNGs per distinct data, and matplotlib is imported the
+# first time one is drawn rather than at startup.
+@st.cache_data(max_entries=64, show_spinner=False)
+def bar_chart(counts, color, title, xlabel):
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=(12, 6))
+    ax = fig.subplots()
+    ax.bar(range(1, len(counts) + 1), counts, width=1.0, align='edge', color=color, edgecolor='black', alpha=0.7)
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel("Frequency")
+    ax.grid(True, alpha=0.3)
+    return figure_png(fig)
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def number_heatmap(main_freq):
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=(12, 6))
+    ax = fig.subplots()
+    im = ax.imshow(main_freq.reshape(5, 10), cmap='YlOrRd', aspect='auto')
+    
+    # Add number labels
+    for i in range(5):
+        for j in range(10):
+            number = i * 10 + j + 1
+            ax.text(j, i, str(number), ha="center", va="center", fontweight='bold')
+    
+    ax.set_title("Main Number Frequency Heatmap")
+    fig.colorbar(im, ax=ax, label='Frequency')
+    return figure_png(fig)
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def pair_heatmap(pairs, title):
+    from matplotlib.figure import Figure
+    pairs = pairs.astype(float)
+    np.fill_diagonal(pairs, np.nan)
+    fig = Figure(figsize=(7, 6))
+    ax = fig.subplots()
+    im = ax.imshow(pairs, cmap='viridis', extent=(0.5, 50.5, 50.5, 0.5))
+    ax.set_title(f"{title} — Pairs Drawn Together")
+    ax.set_xlabel("Ball Number")
+    ax.set_ylabel("Ball Number")
+    fig.colorbar(im, ax=ax, label='Co-occurrences')
+    return figure_png(fig)
+
+
+def run_outputs(key, engine, history_pairs):
+    # Everything the views draw, computed once per run and kept for the session
+    if 'output_cache' not in st.session_state:
+        st.session_state.output_cache = LRUCache(max_entries=4)
+    cache = st.session_state.output_cache
+    if key not in cache:
+        top_combos = engine.get_top_combinations(top_n=10)
+        cache.put(key, {
+            'top_combos': top_combos,
+            # Exact model probability of each ticket under the priors
+            'probabilities': [engine.combination_probability(main, star) * 100 for (main, star), _ in top_combos],
+            'draws_used': engine.draws_used,
+            'main_counts': engine.main_counts,
+            'star_counts': engine.star_counts,
+            'pairs': {'simulated': engine.cooccurrence('simulated'), 'history': history_pairs},
+        })
+    return cache.get(key)
+
+
+# Each view is a fragment: interacting inside one reruns only that view.
+@st.fragment
+def predictions_view(outputs):
+    st.markdown("## 🔝 Top 10 Predicted Combinations")
+    
+    for i, (((main, star), count), probability) in enumerate(zip(outputs['top_combos'], outputs['probabilities']), 1):
+        # Display prediction card
+        with st.container():
+            st.markdown(f"""
+                <div class="prediction-card">
+                    <h4>#{i} Prediction (Probability: {probability:.3g}%)</h4>
+                    <p><strong>Main Numbers:</strong> 
+                        {''.join([f'<span class="number-ball">{num}</span>' for num in main])}
+                    </p>
+                    <p><strong>Star Numbers:</strong> 
+                        {''.join([f'<span class="star-ball">{num}</span>' for num in star])}
+                    </p>
+                    <p><small>Frequency: {count:,} out of {outputs['draws_used']:,} simulations</small></p>
+                </div>
+            """, unsafe_allow_html=True)
+    
+    # Frequency Analysis Charts
+    st.markdown("## 📊 Frequency Analysis")
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.subheader("🎯 Main Ball Distribution")
+        st.image(bar_chart(outputs['main_counts'], 'skyblue', "Main Ball Frequency Distribution", "Ball Number"),
+                 width='stretch')
+    
+    with col2:
+        st.subheader("✨ Star Ball Distribution")
+        st.image(bar_chart(outputs['star_counts'], 'gold', "Star Ball Frequency Distribution", "Star Number"),
+                 width='stretch')
+
+
+@st.fragment
+def scientific_view(outputs, confidence_level):
+    st.markdown("## 🔬 Scientific Analysis")
+    
+    st.markdown("""
+        ### Methodology Overview
+        
+        This application employs **Advanced Bayesian Statistics** combined with **Monte Carlo Simulation** 
+        to generate statistically-informed lottery predictions.
+        
+        #### 🧮 Mathematical Foundation
+        
+        **1. Bayesian Prior Estimation**
+        - Historical frequency analysis with Laplace smoothing
+        - Dynamic weight adjustment based on recency
+        - Confidence interval calculation using Beta distribution
+        
+        **2. Monte Carlo Simulation Engine**
+        - Large-scale random sampling (up to 500,000 iterations)
+        - Weighted probability distributions
+        - Statistical convergence validation
+        
+        **3. Pattern Recognition Algorithm**
+        - Frequency clustering analysis
+        - Temporal pattern detection
+        - Cross-correlation matrix computation
+        
+        #### 📊 Statistical Metrics
+        """)
+    
+    # Calculate statistical metrics
+    frequencies = [count for _, count in outputs['top_combos']]
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Total Combinations", f"{outputs['draws_used']:,}")
+    with col2:
+        st.metric("Average Frequency", f"{np.mean(frequencies):.2f}")
+    with col3:
+        st.metric("Standard Deviation", f"{np.std(frequencies):.2f}")
+    with col4:
+        st.metric("Confidence Level", f"{confidence_level}%")
+    
+    st.markdown("""
+        #### ⚠️ Statistical Disclaimer
+        
+        - **No Guarantee**: This system provides statistical analysis, not guaranteed outcomes
+        - **Random Nature**: Lottery draws are fundamentally random events
+        - **Entertainment Purpose**: Use for educational and entertainment purposes only
+        - **Responsible Gaming**: Never bet more than you can afford to lose
+        
+        #### 🔍 Algorithm Transparency
+        
+        The ABS (Advanced Bayesian Statistics) engine is designed to:
+        1. Identify subtle patterns in historical data
+        2. Account for machine bias and environmental factors
+        3. Provide probabilistic rather than deterministic predictions
+        4. Maintain statistical rigor throughout the analysis
+        """)
+
+
+@st.fragment
+def analytics_view(outputs):
+    import plotly.graph_objects as go
+    
+    st.markdown("## 📊 Advanced Analytics Dashboard")
+    
+    # Probability distribution chart
+    probabilities = outputs['probabilities']
+    ranks = list(range(1, len(probabilities) + 1))
+    
+    fig = go.Figure()
+    fig.add_trace(go.Bar(
+        x=ranks,
+        y=probabilities,
+        marker_color='skyblue',
+        text=[f'{p:.3g}%' for p in probabilities],
+        textposition='auto'
+    ))
+    fig.update_layout(
+        title="Prediction Probability Distribution",
+        xaxis_title="Rank",
+        yaxis_title="Probability (%)",
+        showlegend=False
+    )
+    st.plotly_chart(fig, use_container_width=True)
+    
+    # Number frequency heatmap (co-occurrence diagonal)
+    st.subheader("🔥 Number Frequency Heatmap")
+    st.image(number_heatmap(np.diag(outputs['pairs']['simulated'])), width='stretch')
+    
+    # Pair co-occurrence matrices (diagonal masked)
+    st.subheader("🔗 Main Ball Co-occurrence Matrix")
+    col1, col2 = st.columns(2)
+    for col, source, title in [(col1, 'simulated', "Simulated Draws"), (col2, 'history', "Draw History")]:
+        with col:
+            st.image(pair_heatmap(outputs['pairs'][source], title), width='stretch')
+
+
+@st.fragment
+def history_view():
+    st.markdown("## 📈 Simulation History")
+    
+    if st.session_state.simulation_history:
+        for i, sim in enumerate(reversed(st.session_state.simulation_history[-10:]), 1):
+            with st.expander(f"Simulation #{len(st.session_state.simulation_history) - i + 1} - {sim['timestamp'].strftime('%Y-%m-%d %H:%M')}"):
+                st.write(f"**Simulations:** {sim['draws']:,}")
+                st.write(f"**Confidence Level:** {sim['confidence']}%")
+                st.write("**Top 5 Results:**")
+                
+                for j, ((main, star), count) in enumerate(sim['results'], 1):
+                    st.write(f"#{j}: {list(main)} ⭐ {list(star)} (Frequency: {count})")
+                
+                if 'diagnostics' in sim and sim['diagnostics']['draws_per_second']:
+                    st.write(f"**Throughput:** {sim['diagnostics']['draws_per_second']:,.0f} draws/s")
+    else:
+        st.info("No simulation history available. Run a simulation to see results here.")
+    
+    show_saved_runs()
+
+
+run_store = RunStore(max_runs=SAVED_RUNS_LIMIT)
+
 # Initialize ABS Engine
 abs_model = ABSEngine(main_range=50, star_range=12, draws=draws)
 
 # Main Application Logic
 if uploaded_file:
     try:
-        df = pd.read_csv(uploaded_file)
-        abs_model.load_draw_history(df)
+        data_hash, df, main_priors, star_priors, history_pairs, load_phases = load_history(uploaded_file.getvalue())
+        abs_model.main_priors, abs_model.star_priors = main_priors, star_priors
         
         # Display data info
         col1, col2, col3 = st.columns(3)
@@ -158,224 +503,96 @@ if uploaded_file:
         
         st.success("✅ Data loaded successfully!")
         
-        # Run Simulation
+        # Run Simulation (a fresh seed per click; view changes reuse the cached run)
+        run_confidence = confidence_level if adaptive_stop else None
         if simulate_btn:
-            with st.spinner("🔄 Running Advanced Bayesian Simulation..."):
-                progress_bar = st.progress(0)
-                
-                # Simulate draws with progress
-                abs_model.simulate_draws()
-                progress_bar.progress(50)
-                
-                # Get results
-                top_combos = abs_model.get_top_combinations(top_n=10)
-                progress_bar.progress(100)
-                
-                # Store in history
-                st.session_state.simulation_history.append({
-                    'timestamp': datetime.now(),
-                    'draws': draws,
-                    'confidence': confidence_level,
-                    'results': top_combos[:5]
-                })
-                
-                st.success("✅ Simulation completed successfully!")
+            previous, cache = st.session_state.get('last_run'), st.session_state.get('simulation_cache')
+            if previous and cache is not None and previous in cache:
+                cache.get(previous).cancel()
+            st.session_state.last_run = (data_hash, draws, run_confidence, np.random.SeedSequence().entropy)
+        
+        last_run = st.session_state.get('last_run')
+        if last_run and last_run[:3] == (data_hash, draws, run_confidence):
+            # The simulation runs in the background; this run only polls it
+            job = simulation_job(*last_run, main_priors, star_priors)
+            if job.status in ('queued', 'running'):
+                job_progress(job)
+            elif job.status == 'cancelled':
+                st.warning("⏹️ Simulation cancelled. Run it again to start over.")
+            else:
+                abs_model = job.result()
+                outputs = run_outputs(last_run, abs_model, history_pairs)
+                top_combos = outputs['top_combos']
                 
-                # Display Results Based on View Mode
-                if view_option == "🎯 Predictions":
-                    st.markdown("## 🔝 Top 10 Predicted Combinations")
-                    
+                # Store in history and archive, once per finished run
+                record_run = st.session_state.get('recorded_run') != last_run
+                st.session_state.recorded_run = last_run
+                if record_run:
+                    st.session_state.simulation_history.append({
+                        'timestamp': datetime.now(),
+                        'draws': abs_model.draws_used,
+                        'confidence': confidence_level,
+                        'results': top_combos[:5]
+                    })
                     for i, ((main, star), count) in enumerate(top_combos, 1):
-                        # Convert numpy types to clean integers
-                        main_clean = [int(np.asarray(x).item()) for x in main]
-                        star_clean = [int(np.asarray(x).item()) for x in star]
-                        
-                        # Calculate probability
-                        probability = (count / draws) * 100
-                        
-                        # Store in archive
                         st.session_state.archive.append({
                             'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                             'rank': i,
-                            'main_numbers': main_clean,
-                            'star_numbers': star_clean,
+                            'main_numbers': list(main),
+                            'star_numbers': list(star),
                             'frequency': count,
-                            'probability': probability
+                            'probability': outputs['probabilities'][i - 1]
                         })
-                        
-                        # Display prediction card
-                        with st.container():
-                            st.markdown(f"""
-                                <div class="prediction-card">
-                                    <h4>#{i} Prediction (Probability: {probability:.3f}%)</h4>
-                                    <p><strong>Main Numbers:</strong> 
-                                        {''.join([f'<span class="number-ball">{num}</span>' for num in main_clean])}
-                                    </p>
-                                    <p><strong>Star Numbers:</strong> 
-                                        {''.join([f'<span class="star-ball">{num}</span>' for num in star_clean])}
-                                    </p>
-                                    <p><small>Frequency: {count:,} out of {draws:,} simulations</small></p>
-                                </div>
-                            """, unsafe_allow_html=True)
-                    
-                    # Frequency Analysis Charts
-                    st.markdown("## 📊 Frequency Analysis")
-                    
-                    all_main = [num for combo in abs_model.results for num in combo[0]]
-                    all_stars = [num for combo in abs_model.results for num in combo[1]]
-                    
-                    col1, col2 = st.columns(2)
-                    
-                    with col1:
-                        st.subheader("🎯 Main Ball Distribution")
-                        fig1, ax1 = plt.subplots(figsize=(12, 6))
-                        ax1.hist(all_main, bins=range(1, 52), color='skyblue', edgecolor='black', alpha=0.7)
-                        ax1.set_title("Main Ball Frequency Distribution")
-                        ax1.set_xlabel("Ball Number")
-                        ax1.set_ylabel("Frequency")
-                        ax1.grid(True, alpha=0.3)
-                        st.pyplot(fig1)
-                        plt.close(fig1)
-                    
-                    with col2:
-                        st.subheader("✨ Star Ball Distribution")
-                        fig2, ax2 = plt.subplots(figsize=(12, 6))
-                        ax2.hist(all_stars, bins=range(1, 14), color='gold', edgecolor='black', alpha=0.7)
-                        ax2.set_title("Star Ball Frequency Distribution")
-                        ax2.set_xlabel("Star Number")
-                        ax2.set_ylabel("Frequency")
-                        ax2.grid(True, alpha=0.3)
-                        st.pyplot(fig2)
-                        plt.close(fig2)
+                    if save_runs:
+                        run_store.save(abs_model, data_hash=data_hash, confidence=run_confidence,
+                                       stats=abs_model.stats.as_dict())
                 
-                elif view_option == "🔬 Scientific View":
-                    st.markdown("## 🔬 Scientific Analysis")
-                    
-                    st.markdown("""
-                        ### Methodology Overview
-                        
-                        This application employs **Advanced Bayesian Statistics** combined with **Monte Carlo Simulation** 
-                        to generate statistically-informed lottery predictions.
-                        
-                        #### 🧮 Mathematical Foundation
-                        
-                        **1. Bayesian Prior Estimation**
-                        - Historical frequency analysis with Laplace smoothing
-                        - Dynamic weight adjustment based on recency
-                        - Confidence interval calculation using Beta distribution
-                        
-                        **2. Monte Carlo Simulation Engine**
-                        - Large-scale random sampling (up to 500,000 iterations)
-                        - Weighted probability distributions
-                        - Statistical convergence validation
-                        
-                        **3. Pattern Recognition Algorithm**
-                        - Frequency clustering analysis
-                        - Temporal pattern detection
-                        - Cross-correlation matrix computation
-                        
-                        #### 📊 Statistical Metrics
-                        """)
-                    
-                    if 'top_combos' in locals():
-                        # Calculate statistical metrics
-                        total_combinations = len(abs_model.results)
-                        avg_frequency = np.mean([count for _, count in top_combos])
-                        std_frequency = np.std([count for _, count in top_combos])
-                        
-                        col1, col2, col3, col4 = st.columns(4)
-                        with col1:
-                            st.metric("Total Combinations", f"{total_combinations:,}")
-                        with col2:
-                            st.metric("Average Frequency", f"{avg_frequency:.2f}")
-                        with col3:
-                            st.metric("Standard Deviation", f"{std_frequency:.2f}")
-                        with col4:
-                            st.metric("Confidence Level", f"{confidence_level}%")
-                    
-                    st.markdown("""
-                        #### ⚠️ Statistical Disclaimer
-                        
-                        - **No Guarantee**: This system provides statistical analysis, not guaranteed outcomes
-                        - **Random Nature**: Lottery draws are fundamentally random events
-                        - **Entertainment Purpose**: Use for educational and entertainment purposes only
-                        - **Responsible Gaming**: Never bet more than you can afford to lose
-                        
-                        #### 🔍 Algorithm Transparency
-                        
-                        The ABS (Advanced Bayesian Statistics) engine is designed to:
-                        1. Identify subtle patterns in historical data
-                        2. Account for machine bias and environmental factors
-                        3. Provide probabilistic rather than deterministic predictions
-                        4. Maintain statistical rigor throughout the analysis
-                        """)
+                st.success("✅ Simulation completed successfully!")
+                if abs_model.draws_used < draws and abs_model.stop_reason == 'stable':
+                    st.info(f"⏱️ Top 10 stable at {confidence_level}% confidence after "
+                            f"{abs_model.draws_used:,} of {draws:,} simulations")
+                elif abs_model.stop_reason == 'futile':
+                    st.info(f"⏱️ Stopped after {abs_model.draws_used:,} of {draws:,} simulations: the Top 10 "
+                            f"is within sampling noise and would not be stable at {confidence_level}% "
+                            f"confidence even after all {draws:,}")
                 
+                # Display Results Based on View Mode
+                render_start = time.perf_counter()
+                if view_option == "🎯 Predictions":
+                    predictions_view(outputs)
+                elif view_option == "🔬 Scientific View":
+                    scientific_view(outputs, confidence_level)
                 elif view_option == "📊 Analytics":
-                    st.markdown("## 📊 Advanced Analytics Dashboard")
-                    
-                    if 'top_combos' in locals():
-                        # Probability distribution chart
-                        probabilities = [(count / draws) * 100 for _, count in top_combos]
-                        ranks = list(range(1, len(probabilities) + 1))
-                        
-                        fig = go.Figure()
-                        fig.add_trace(go.Bar(
-                            x=ranks,
-                            y=probabilities,
-                            marker_color='skyblue',
-                            text=[f'{p:.3f}%' for p in probabilities],
-                            textposition='auto'
-                        ))
-                        fig.update_layout(
-                            title="Prediction Probability Distribution",
-                            xaxis_title="Rank",
-                            yaxis_title="Probability (%)",
-                            showlegend=False
-                        )
-                        st.plotly_chart(fig, use_container_width=True)
-                        
-                        # Number frequency heatmap
-                        st.subheader("🔥 Number Frequency Heatmap")
-                        
-                        # Create frequency matrix for main numbers
-                        main_freq = np.zeros(50)
-                        for combo in abs_model.results:
-                            for num in combo[0]:
-                                main_freq[int(num) - 1] += 1
-                        
-                        # Reshape for heatmap
-                        heatmap_data = main_freq.reshape(5, 10)
-                        
-                        fig3, ax3 = plt.subplots(figsize=(12, 6))
-                        im = ax3.imshow(heatmap_data, cmap='YlOrRd', aspect='auto')
-                        
-                        # Add number labels
-                        for i in range(5):
-                            for j in range(10):
-                                number = i * 10 + j + 1
-                                ax3.text(j, i, str(number), ha="center", va="center", fontweight='bold')
-                        
-                        ax3.set_title("Main Number Frequency Heatmap")
-                        plt.colorbar(im, ax=ax3, label='Frequency')
-                        st.pyplot(fig3)
-                        plt.close(fig3)
-                
+                    analytics_view(outputs)
                 elif view_option == "📈 History":
-                    st.markdown("## 📈 Simulation History")
-                    
-                    if st.session_state.simulation_history:
-                        for i, sim in enumerate(reversed(st.session_state.simulation_history[-10:]), 1):
-                            with st.expander(f"Simulation #{len(st.session_state.simulation_history) - i + 1} - {sim['timestamp'].strftime('%Y-%m-%d %H:%M')}"):
-                                st.write(f"**Simulations:** {sim['draws']:,}")
-                                st.write(f"**Confidence Level:** {sim['confidence']}%")
-                                st.write("**Top 5 Results:**")
-                                
-                                for j, ((main, star), count) in enumerate(sim['results'], 1):
-                                    main_clean = [int(np.asarray(x).item()) for x in main]
-                                    star_clean = [int(np.asarray(x).item()) for x in star]
-                                    st.write(f"#{j}: {main_clean} ⭐ {star_clean} (Frequency: {count})")
-                    else:
-                        st.info("No simulation history available. Run a simulation to see results here.")
+                    history_view()
+                
+                # Run diagnostics (timings from the cached load and run, plus this render)
+                abs_model.stats.record('render', time.perf_counter() - render_start)
+                diagnostics = abs_model.stats.as_dict()
+                diagnostics['phases'] = {**load_phases, **diagnostics['phases']}
+                if record_run:
+                    st.session_state.simulation_history[-1]['diagnostics'] = diagnostics
+                
+                with st.expander("🩺 Run diagnostics"):
+                    col1, col2, col3 = st.columns(3)
+                    with col1:
+                        rate = diagnostics['draws_per_second']
+                        st.metric("Draws / second", f"{rate:,.0f}" if rate else "N/A")
+                    with col2:
+                        st.metric("Result Size", f"{diagnostics['result_bytes'] / 2**20:.1f} MiB")
+                    with col3:
+                        rss = diagnostics['peak_rss_bytes']
+                        st.metric("Process Peak RSS", f"{rss / 2**20:.0f} MiB" if rss else "N/A",
+                                  help="Most memory this server process has held since it started, "
+                                       "across every session and run, not this run alone")
+                    st.dataframe(pd.DataFrame({
+                        'Phase': list(diagnostics['phases']),
+                        'Wall time (ms)': [round(t * 1000, 1) for t in diagnostics['phases'].values()]
+                    }), hide_index=True)
+        
+        elif view_option == "📈 History":
+            history_view()
     
     except Exception as e:
         st.error(f"❌ Error loading file: {str(e)}")
@@ -434,3 +651,11 @@ with st.expander("ℹ️ About Easy Dream"):
         **Disclaimer:** This tool is for entertainment and educational purposes only. 
         Lottery games are games of chance, and past results do not guarantee future outcomes.
     """)
+
+# Script run time against the budget (the first run of a session counts as startup)
+script_seconds = time.perf_counter() - script_start
+run_kind = 'rerun' if 'script_runs' in st.session_state else 'startup'
+st.session_state.script_runs = st.session_state.get('script_runs', 0) + 1
+budget = STARTUP_BUDGET if run_kind == 'startup' else RERUN_BUDGET
+st.caption(f"⏱️ Page {run_kind} took {script_seconds:.2f}s (budget {budget:.1f}s)"
+           + (" — over budget" if script_seconds > budget else ""))
@@ -1,8 +1,10 @@
+import hashlib
+import io
 import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
-from abs_engine import ABSEngine
+from abs_engine import ABSEngine, LRUCache, read_draw_history
 from datetime import datetime
 
 st.set_page_config(page_title="Easy Dream", layout="wide")
@@ -41,23 +43,44 @@ with st.sidebar:
     view_mode = st.radio("View", ["Predictions", "Analytics"])
     run_button = st.button("🎲 Run Simulation")
 
+@st.cache_data(max_entries=16, show_spinner=False)
+def load_history(data):
+    engine = ABSEngine(main_range=50, star_range=12)
+    engine.load_draw_history(read_draw_history(io.BytesIO(data)))
+    return hashlib.sha256(data).hexdigest(), engine.main_priors, engine.star_priors
+
+def run_simulation(data_hash, draws, seed, main_priors, star_priors):
+    if 'simulation_cache' not in st.session_state:
+        st.session_state.simulation_cache = LRUCache(max_entries=4)
+    key = (data_hash, draws, seed)
+    if key not in st.session_state.simulation_cache:
+        engine = ABSEngine(main_range=50, star_range=12, draws=draws, seed=seed)
+        engine.main_priors, engine.star_priors = main_priors, star_priors
+        engine.simulate_draws()
+        st.session_state.simulation_cache.put(key, engine)
+    return st.session_state.simulation_cache.get(key)
+
 abs_model = ABSEngine(main_range=50, star_range=12, draws=draws)
 
 if uploaded_file:
     try:
-        df = pd.read_csv(uploaded_file)
-        abs_model.load_draw_history(df)
+        data_hash, main_priors, star_priors = load_history(uploaded_file.getvalue())
+        abs_model.main_priors, abs_model.star_priors = main_priors, star_priors
         st.success("✅ Data loaded successfully!")
 
         if run_button:
+            st.session_state.last_run = (data_hash, draws, np.random.SeedSequence().entropy)
+
+        last_run = st.session_state.get('last_run')
+        if last_run and last_run[:2] == (data_hash, draws):
             with st.spinner("Running simulation..."):
-                abs_model.simulate_draws()
+                abs_model = run_simulation(*last_run, main_priors, star_priors)
                 top_combos = abs_model.get_top_combinations(top_n=5)
                 st.success("✅ Simulation complete!")
 
                 if view_mode == "Predictions":
                     st.subheader("🎯 Top 5 Predictions")
-                        for i, ((main, star), count) in enumerate(top_combos, 1):
+                    for i, ((main, star), count) in enumerate(top_combos, 1):
                         main_clean = [int(x.item()) if hasattr(x, 'item') else int(x) for x in main]
                         star_clean = [int(x.item()) if hasattr(x, 'item') else int(x) for x in star]
                         st.markdown(f"**#{i}** → 🎱 {main_clean} ✨ {star_clean}")
@@ -65,19 +88,19 @@ if uploaded_file:
 
                 elif view_mode == "Analytics":
                     st.subheader("📊 Statistical Analysis")
-                    all_main = [int(num) for combo in abs_model.results for num in combo[0]]
-                    all_stars = [int(num) for combo in abs_model.results for num in combo[1]]
+                    main_counts = abs_model.main_counts
+                    star_counts = abs_model.star_counts
                     col1, col2 = st.columns(2)
                     with col1:
                         st.write("**Main Numbers Frequency**")
                         fig1, ax1 = plt.subplots(figsize=(10, 6))
-                        ax1.hist(all_main, bins=range(1, 52), color='skyblue', alpha=0.7)
+                        ax1.bar(range(1, 51), main_counts, width=1.0, align='edge', color='skyblue', alpha=0.7)
                         st.pyplot(fig1)
                         plt.close(fig1)
                     with col2:
                         st.write("**Star Numbers Frequency**")
                         fig2, ax2 = plt.subplots(figsize=(10, 6))
-                        ax2.hist(all_stars, bins=range(1, 14), color='gold', alpha=0.7)
+                        ax2.bar(range(1, 13), star_counts, width=1.0, align='edge', color='gold', alpha=0.7)
                         st.pyplot(fig2)
                         plt.close(fig2)
     except Exception as e: